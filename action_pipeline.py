@@ -0,0 +1,204 @@
+"""
+One pass over each turn's actions, feeding any number of analyses at once.
+Analyses register a handler for each action type they care about, so adding
+another analysis doesn't mean downloading or walking the game again.
+
+    pipeline = ActionPipeline([UnitsBuilt(), Captures()])
+    for turn, turn_json in turns:
+        pipeline.feed(turn, turn_json)
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from data_objects import load_unit_costs
+
+
+# Called with (turn, action)
+Handler = Callable[[int, Dict], None]
+
+# Register for this to see every action, before the handlers for its type
+ANY_ACTION = "*"
+
+
+class Analysis():
+    """
+    Base class for anything fed by an `ActionPipeline`. Override `register` to
+    add handlers, and `start_turn`/`end_turn` for per-turn work.
+    """
+
+    def register(self, pipeline: "ActionPipeline") -> None:
+        pass
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        pass
+
+    def end_turn(self, turn: int, turn_json: Dict) -> None:
+        pass
+
+
+class ActionPipeline():
+
+    def __init__(self, analyses: Iterable[Analysis] = ()):
+        self.analyses: List[Analysis] = []
+        self._handlers: Dict[str, List[Handler]] = {}
+        for analysis in analyses:
+            self.add(analysis)
+
+    def add(self, analysis: Analysis) -> Analysis:
+        self.analyses.append(analysis)
+        analysis.register(self)
+        return analysis
+
+    def on(self, action_type: str, handler: Handler) -> None:
+        """
+        Call `handler` for every action of this type ("Build", "Fire", etc), or
+        for every action if `action_type` is `ANY_ACTION`.
+        """
+        self._handlers.setdefault(action_type, []).append(handler)
+
+    def feed(self, turn: int, turn_json: Dict) -> None:
+        for analysis in self.analyses:
+            analysis.start_turn(turn, turn_json)
+
+        handlers = self._handlers
+        any_action = handlers.get(ANY_ACTION, ())
+        for action in turn_json["actions"]:
+            for handler in any_action:
+                handler(turn, action)
+            for handler in handlers.get(action["action"], ()):
+                handler(turn, action)
+
+        for analysis in self.analyses:
+            analysis.end_turn(turn, turn_json)
+
+
+def current_player(turn_json: Dict) -> int:
+    return int(turn_json["gameState"]["currentTurnPId"])
+
+
+def current_day(turn: int, turn_json: Dict) -> int:
+    """
+    The day `turn` is on. Every player has a turn each day (until they are
+    eliminated), so if the gameState doesn't say, it's worked out from how
+    many players there are.
+    """
+    game_state = turn_json["gameState"]
+    day = game_state.get("day")
+    return int(day) if day is not None else turn // len(game_state["players"]) + 1
+
+
+class UnitsBuilt(Analysis):
+    """
+    Units built this turn (`turn_units`), and in total by each player.
+    """
+
+    def __init__(self):
+        self.turn_units: Dict[str, int] = {}
+        self.by_player: Dict[int, Dict[str, int]] = {}
+        self._player: Optional[int] = None
+
+    def register(self, pipeline: ActionPipeline) -> None:
+        pipeline.on("Build", self.on_build)
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        self.turn_units = {}
+        self._player = current_player(turn_json)
+
+    def on_build(self, turn: int, action: Dict) -> None:
+        unit_name = action["newUnit"]["units_name"]
+        self.turn_units[unit_name] = self.turn_units.get(unit_name, 0) + 1
+
+        player_units = self.by_player.setdefault(self._player, {})
+        player_units[unit_name] = player_units.get(unit_name, 0) + 1
+
+
+class Captures(Analysis):
+    """
+    Income properties captured this turn (`turn_captures`), and each player's
+    captures per day. Com towers and labs don't give income, so don't count.
+    """
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.turn_captures = 0
+        self.by_day: Dict[int, Dict[int, int]] = {}  # players_id: {day: captures}
+        self._player: Optional[int] = None
+        self._day = 1
+
+    def register(self, pipeline: ActionPipeline) -> None:
+        pipeline.on("Capt", self.on_capture)
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        self.turn_captures = 0
+        self._player = current_player(turn_json)
+        self._day = current_day(turn, turn_json)
+
+    def on_capture(self, turn: int, action: Dict) -> None:
+        building = action["buildingInfo"]
+        if building["buildings_capture"] != 20:
+            return
+        terrain_name = building["terrain_name"].lower()
+        if "com tower" in terrain_name:
+            if self.verbose:
+                print("Com tower captured")
+            return
+        if terrain_name.endswith("lab"):
+            if self.verbose:
+                print("Lab captured. Why?")
+            return
+
+        self.turn_captures += 1
+        days = self.by_day.setdefault(self._player, {})
+        days[self._day] = days.get(self._day, 0) + 1
+
+
+class CombatDamage(Analysis):
+    """
+    Value (in funds) of the damage each player dealt. Only counts fights where
+    both units' HP beforehand is known - units hidden in fog are skipped.
+    """
+
+    def __init__(self, unit_costs: Optional[Dict[str, int]] = None):
+        self.unit_costs = unit_costs
+        self.dealt: Dict[int, int] = {}  # players_id: funds
+        self._units: Dict[int, Tuple[int, int, int]] = {}  # units_id: (players_id, HP, cost)
+
+    def register(self, pipeline: ActionPipeline) -> None:
+        pipeline.on("Build", self.on_build)
+        pipeline.on("Move", self.on_move)
+        pipeline.on("Fire", self.on_fire)
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        if self.unit_costs is None:
+            self.unit_costs = load_unit_costs(turn_json["gameState"].get("generic_units"))
+        for data in turn_json["gameState"]["units"].values():
+            self._track(data)
+
+    def _track(self, data: Dict) -> None:
+        cost = data.get("units_cost") or self.unit_costs.get(str(data.get("units_name")).lower(), 0)
+        self._units[int(data["units_id"])] = (int(data["units_players_id"]), data["units_hit_points"], cost)
+
+    def on_build(self, turn: int, action: Dict) -> None:
+        self._track(action["newUnit"])
+
+    def on_move(self, turn: int, action: Dict) -> None:
+        unit = action["unit"]
+        if unit.get("units_hit_points") is not None:
+            self._track(unit)
+
+    def on_fire(self, turn: int, action: Dict) -> None:
+        attacker, defender = action.get("attacker"), action.get("defender")
+        if not isinstance(attacker, dict) or not isinstance(defender, dict):
+            return
+        self._hit(defender, self._units.get(attacker["units_id"]))
+        self._hit(attacker, self._units.get(defender["units_id"]))
+
+    def _hit(self, target: Dict, source: Optional[Tuple[int, int, int]]) -> None:
+        known = self._units.get(target["units_id"])
+        hit_points = target.get("units_hit_points")
+        if known is None or source is None or hit_points is None:
+            return
+        players_id, before, cost = known
+        if before is not None and before > hit_points:
+            self.dealt[source[0]] = self.dealt.get(source[0], 0) + round((before - hit_points) * cost / 10)
+        self._units[target["units_id"]] = (players_id, hit_points, cost)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Long-running build order service, for bots and other tools that would
+otherwise start `build_order_analyser.py` once per request. It logs in once,
+keeps recently used turns decoded in memory, and shares one download between
+concurrent requests for the same turn.
+
+    GET /build-order/<game_id>[?summary=1]  Every unit's build turn, as JSON
+    GET /turn/<game_id>/<turn>              One load_replay.php response
+    GET /metrics                            Cache, coalescing and latency stats
+    GET /health
+"""
+
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import argparse
+import collections
+import json_codec
+import logging
+import threading
+import time
+
+from action_pipeline import Captures, CombatDamage, UnitsBuilt
+from awbw_api import load_replay
+from build_order_analyser import DEFAULT_WORKERS, Analyser
+from export import BUILD_ORDER_FIELDS, ListWriter
+from profiling import percentiles
+from session import get_cookie
+from transport import DEFAULT_RATE, LATENCY_WINDOW, Transport
+from turn_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, FRESH_SECONDS, TurnCache, is_game_over
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8321
+# Decoded turns kept in memory. Late-game turns can be a few MB each.
+DEFAULT_MEMORY_TURNS = 2000
+
+
+class Coalescer():
+    """
+    Runs one call per key at a time. Anyone asking for a key that is already
+    being worked on waits for that call's result (or exception), instead of
+    starting another.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._pending.get(key)
+            leader = future is None
+            if leader:
+                future = self._pending[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(function())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._pending[key]
+        return future.result()
+
+
+@dataclass
+class MemoryStats:
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    evictions: int = 0
+
+
+class TurnMemory():
+    """
+    Least recently used decoded turns. Like the turn cache, the newest turn of
+    a live game is only trusted for a few seconds, as actions are still being
+    added to it.
+    """
+
+    def __init__(self, max_turns: int = DEFAULT_MEMORY_TURNS):
+        self.max_turns = max_turns
+        self.stats = MemoryStats()
+        self._turns: "collections.OrderedDict[Tuple[int, int], Tuple[Dict, float]]" = collections.OrderedDict()
+        self._newest: Dict[int, int] = {}  # game_id: newest turn seen
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def get(self, game_id: int, turn: int) -> Optional[Dict]:
+        key = (game_id, turn)
+        with self._lock:
+            entry = self._turns.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            turn_json, fetched_at = entry
+            final = turn < self._newest.get(game_id, turn) or is_game_over(turn_json)
+            if not final and time.time() - fetched_at > FRESH_SECONDS:
+                del self._turns[key]
+                self.stats.misses += 1
+                self.stats.stale += 1
+                return None
+
+            self._turns.move_to_end(key)
+            self.stats.hits += 1
+            return turn_json
+
+    def put(self, game_id: int, turn: int, turn_json: Dict) -> None:
+        with self._lock:
+            self._turns[(game_id, turn)] = (turn_json, time.time())
+            self._turns.move_to_end((game_id, turn))
+            self._newest[game_id] = max(turn, self._newest.get(game_id, turn))
+            while len(self._turns) > self.max_turns:
+                self._turns.popitem(last=False)
+                self.stats.evictions += 1
+
+
+class AnalysisService():
+
+    def __init__(
+        self,
+        cache: Optional[TurnCache] = None,
+        transport: Optional[Transport] = None,
+        workers: int = DEFAULT_WORKERS,
+        memory_turns: int = DEFAULT_MEMORY_TURNS,
+    ):
+        self.cache = cache
+        self.transport = transport or Transport()
+        self.workers = workers
+        self.memory = TurnMemory(memory_turns)
+        self.coalescer = Coalescer()
+        self.started = time.time()
+        self.upstream = 0
+        self.latencies: Dict[str, Deque[float]] = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self._lock = threading.Lock()
+
+        # Logging in is a round trip to the homepage - only do it once
+        self.cookie = get_cookie(self.transport)
+
+    def load_turn(
+        self,
+        game_id: str,
+        turn: int,
+        cookie: Optional[Dict] = None,
+        cache: Optional[TurnCache] = None,
+        transport: Optional[Transport] = None,
+    ) -> Dict:
+        """
+        Same as `load_replay`, but from memory if possible, and only one
+        download at a time for each turn.
+        """
+        key = (int(game_id), turn)
+        turn_json = self.memory.get(*key)
+        if turn_json is not None:
+            return turn_json
+
+        def download() -> Dict:
+            with self._lock:
+                self.upstream += 1
+            turn_json = load_replay(game_id, turn, cookie or self.cookie, cache or self.cache, transport or self.transport)
+            self.memory.put(*key, turn_json)
+            return turn_json
+
+        return self.coalescer.run(("turn",) + key, download)
+
+    def build_order(self, game_id: str, summary: bool = False) -> Optional[Dict]:
+        """
+        The same results as `build_order_analyser.py --export`, or None if the
+        game has no turns we can see. Identical requests that arrive together
+        share one analysis.
+        """
+        return self.coalescer.run(("build_order", int(game_id), summary), lambda: self._build_order(game_id, summary))
+
+    def _build_order(self, game_id: str, summary: bool) -> Optional[Dict]:
+        analyser = Analyser(
+            game_id,
+            cache=self.cache,
+            workers=self.workers,
+            transport=self.transport,
+            cookie=self.cookie,
+            load=self.load_turn,
+        )
+        analyser.show_progress = False
+        if summary:
+            units_built = analyser.pipeline.add(UnitsBuilt())
+            captures = analyser.pipeline.add(Captures())
+            damage = analyser.pipeline.add(CombatDamage())
+
+        all_units = {}
+        # A build order missing turns would look complete - fail the request
+        max_turn = analyser.gather_units(all_units, strict=True)
+        if max_turn is None:
+            return None
+        analyser.infer_turn_built(all_units, max_turn)
+
+        writer = ListWriter(BUILD_ORDER_FIELDS)
+        analyser.export_units(all_units, writer)
+        result = {
+            "game_id": int(game_id),
+            "turns": max_turn + 1,
+            "me": analyser.me.players_id,
+            "units": writer.rows,
+        }
+        if summary:
+            result["summary"] = analyser.summarise(units_built, captures, damage)
+        return result
+
+    def record_latency(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = {endpoint: percentiles(list(latencies)) for endpoint, latencies in self.latencies.items()}
+        return {
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "requests": requests,
+            "memory": {**asdict(self.memory.stats), "turns": len(self.memory)},
+            "coalesced": self.coalescer.coalesced,
+            "upstream_turn_loads": self.upstream,
+            "turn_cache": asdict(self.cache.stats) if self.cache is not None else None,
+            "upstream_latency": self.transport.latency_summary(),
+        }
+
+
+class ServiceServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, service: AnalysisService, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        super().__init__((host, port), ServiceHandler)
+        self.service = service
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+
+    server: ServiceServer
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format, *args)
+
+    def send_json(self, status: int, value: Any) -> None:
+        body = json_codec.dumps(value)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        endpoint = parts[0] if parts else ""
+        service = self.server.service
+
+        try:
+            if endpoint == "health" and len(parts) == 1:
+                self.send_json(200, {"ok": True})
+            elif endpoint == "metrics" and len(parts) == 1:
+                self.send_json(200, service.metrics())
+            elif endpoint == "build-order" and len(parts) == 2 and parts[1].isdigit():
+                summary = parse_qs(url.query).get("summary", ["0"])[0] not in ("0", "false", "")
+                result = service.build_order(parts[1], summary)
+                if result is None:
+                    self.send_json(404, {"error": f"No turns found for game {parts[1]}"})
+                else:
+                    self.send_json(200, result)
+            elif endpoint == "turn" and len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+                try:
+                    self.send_json(200, service.load_turn(parts[1], int(parts[2])))
+                except RuntimeError as e:
+                    # The server refused (e.g: the turn doesn't exist)
+                    self.send_json(404, {"error": str(e)})
+            else:
+                endpoint = "unknown"
+                self.send_json(404, {"error": f"Unknown path {url.path}"})
+        except Exception as e:
+            logger.exception(e)
+            self.send_json(500, {"error": str(e)})
+
+        service.record_latency(endpoint, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve build orders over HTTP, keeping turns and the AWBW session warm.")
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default 127.0.0.1)."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on (default {DEFAULT_PORT})."
+    )
+    parser.add_argument(
+        "--memory-turns",
+        type=int,
+        default=DEFAULT_MEMORY_TURNS,
+        help=f"How many decoded turns to keep in memory (default {DEFAULT_MEMORY_TURNS})."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't use the on-disk turn cache behind the in-memory one."
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="Where to keep the turn cache."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Maximum size of the turn cache, in MB."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"How many turns each request downloads at once (default {DEFAULT_WORKERS})."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Maximum requests per second sent to AWBW, across every request (default {DEFAULT_RATE}). Use 0 for no limit."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    cache = None
+    if not args.no_cache:
+        cache = TurnCache(args.cache_path, args.cache_size * 1024 * 1024)
+
+    transport = Transport(rate=args.rate, burst=max(1, args.workers))
+    service = AnalysisService(cache, transport, args.workers, args.memory_turns)
+    server = ServiceServer(service, args.host, args.port)
+    print(f"Serving build orders on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
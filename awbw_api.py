@@ -0,0 +1,187 @@
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from transport import Transport, default_transport
+from turn_cache import TurnCache
+
+import collections
+import itertools
+import json_codec
+import os
+import profiling
+
+
+# Can be pointed somewhere else (e.g: the benchmark stub server)
+BASE_URL = os.environ.get("AWBW_BASE_URL", "https://awbw.amarriner.com")
+CREDS_PATH = os.environ.get("AWBW_CREDS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "creds.json"))
+REPLAY_URL = BASE_URL + "/api/game/load_replay.php"
+
+
+def load_replay(
+    game_id: str,
+    turn: int,
+    cookie: Dict,
+    cache: Optional[TurnCache] = None,
+    transport: Optional[Transport] = None,
+) -> Dict:
+    """
+    Get the load_replay.php response for one turn of a game, from the cache if
+    we already have it.
+
+    Raises a RuntimeError if the server refused (e.g: the turn doesn't exist).
+    """
+    if cache is not None:
+        with profiling.phase("cache_read", turn):
+            turn_json = cache.get(game_id, turn)
+        if turn_json is not None:
+            return turn_json
+
+    transport = transport or default_transport()
+    sent_session = cookie.get("PHPSESSID")
+    turn_json, raw = request_turn(game_id, turn, cookie, transport)
+    if cookie.get("awbw_password") is not None:
+        import session  # Only needed once the saved session stops working
+
+        if session.looks_logged_out(turn, turn_json) and session.revalidate(cookie, sent_session, transport):
+            if cache is not None:
+                for logged_out_game_id, logged_out_turn in session.logged_out_turns(sent_session):
+                    cache.forget(logged_out_game_id, logged_out_turn)
+            sent_session = cookie.get("PHPSESSID")
+            turn_json, raw = request_turn(game_id, turn, cookie, transport)
+        session.note_response(sent_session, game_id, turn, turn_json)
+
+    if cache is not None:
+        with profiling.phase("cache_write", turn):
+            cache.put(game_id, turn, turn_json, raw)
+
+    return turn_json
+
+
+def request_turn(game_id: str, turn: int, cookie: Dict, transport: Transport) -> Tuple[Dict, bytes]:
+    """
+    Download one turn, as (turn_json, response body).
+    """
+    body = {
+        "gameId": game_id,
+        "turn": turn,
+        "initial": True,  # Don't know what this does
+    }
+
+    with profiling.phase("network", turn):
+        response = transport.post(
+            REPLAY_URL,
+            cookies=cookie,
+            json=body,
+        )
+
+    if response.status_code != 200:
+        raise Exception(f"Got bad response code: {response.status_code}")
+    with profiling.phase("json_decode", turn):
+        turn_json = json_codec.loads(response.content)
+    if "err" in turn_json:
+        raise RuntimeError(turn_json["message"])
+    return turn_json, response.content
+
+
+# Anything with the same signature as `load_replay` (e.g: the service's
+# in-memory turns) can be used in its place
+TurnLoader = Callable[[str, int, Dict, Optional[TurnCache], Optional[Transport]], Dict]
+
+
+def get_turn_count(
+    game_id: str,
+    cookie: Dict,
+    cache: Optional[TurnCache] = None,
+    transport: Optional[Transport] = None,
+    known_turn: int = 0,
+    limit: Optional[int] = None,
+    load: Optional[TurnLoader] = None,
+) -> int:
+    """
+    How many turns the game has so far (or `limit`, if it has at least that
+    many). `known_turn` must exist.
+
+    Replay responses don't say how many turns there are, so the end of the
+    game is found with a galloping search from `known_turn`: a handful of
+    requests instead of one per turn. Turns it finds are cached, so with a
+    cache only the requests past the end are extra.
+    """
+    load = load or load_replay
+    if cache is not None:
+        # Start from the newest turn we have - it, and every turn before it,
+        # exists
+        known_turn = max(known_turn, cache.latest_turn(game_id) or 0)
+    if limit is not None and limit <= known_turn + 1:
+        return limit
+
+    with profiling.phase("turn_count"):
+        def turn_exists(turn: int) -> bool:
+            try:
+                load(game_id, turn, cookie, cache, transport)
+            except RuntimeError:
+                return False
+            return True
+
+        if limit is not None and turn_exists(limit - 1):
+            return limit
+
+        # Double the step until we overshoot, then binary search back
+        last_found, step = known_turn, 1
+        while turn_exists(last_found + step):
+            last_found += step
+            step *= 2
+        missing = last_found + step
+        while missing - last_found > 1:
+            middle = (last_found + missing) // 2
+            if turn_exists(middle):
+                last_found = middle
+            else:
+                missing = middle
+
+    return last_found + 1
+
+
+def fetch_turns(
+    game_id: str,
+    turns: Iterable[int],
+    cookie: Dict,
+    cache: Optional[TurnCache] = None,
+    transport: Optional[Transport] = None,
+    workers: int = 1,
+    load: Optional[TurnLoader] = None,
+) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yield `(turn, turn_json)` in turn order, with up to `workers` requests in
+    flight at once.
+
+    The first failing turn raises its exception here, and anything requested
+    after it is thrown away. Use `get_turn_count` to only ask for turns that
+    exist.
+    """
+    load = load or load_replay
+    if workers <= 1:
+        for turn in turns:
+            yield turn, load(game_id, turn, cookie, cache, transport)
+        return
+
+    turns = iter(turns)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(turn: int) -> None:
+            pending.append((turn, executor.submit(load, game_id, turn, cookie, cache, transport)))
+
+        try:
+            for turn in itertools.islice(turns, workers):
+                submit(turn)
+
+            while pending:
+                turn, future = pending.popleft()
+                turn_json = future.result()
+
+                # Keep the pool busy while the caller works on this turn
+                for next_turn in itertools.islice(turns, 1):
+                    submit(next_turn)
+
+                yield turn, turn_json
+        finally:
+            for _, future in pending:
+                future.cancel()
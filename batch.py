@@ -0,0 +1,121 @@
+"""
+Analyses a batch of games over several processes, for both tools. Every
+process opens its own connections and turn cache (the cache file itself is
+shared), each game's output is kept together so that games running at the same
+time don't print over each other, and each game's profiling numbers are sent
+back to the main process.
+
+    jobs = [(game_id, analyse_one_game, (game_id, ...)) for game_id in game_ids]
+    for game_id, result in run_batch(jobs, processes, cookie, cache, rate, workers):
+        ...
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import contextlib
+import io
+
+import profiling
+from transport import Transport
+from turn_cache import TurnCache
+
+
+@dataclass
+class Worker():
+    cookie: Dict
+    cache: Optional[TurnCache]
+    transport: Transport
+
+
+# This process' connections, in a batch process
+worker: Optional[Worker] = None
+
+
+def init_worker(
+    cookie: Dict,
+    cache_path: Optional[str],
+    cache_bytes: int,
+    rate: Optional[float],
+    workers: int,
+    profile: bool = False,
+    setup: Optional[Callable[[Worker], None]] = None,
+) -> None:
+    """
+    Runs once in each batch process. Connections and the cache database can't
+    be shared with the parent, so every process opens its own. `setup` gets
+    them too, for tools that keep them in globals.
+    """
+    global worker
+    worker = Worker(
+        cookie,
+        TurnCache(cache_path, cache_bytes) if cache_path else None,
+        Transport(rate=rate, burst=max(1, workers)),
+    )
+    if setup is not None:
+        setup(worker)
+    if profile:
+        profiling.enable()
+
+
+def run_quietly(name: str, function: Callable[..., Any], args: Tuple) -> Tuple[str, Any, Optional[Dict]]:
+    """
+    Run one game of a batch, keeping everything it prints. Returns the output,
+    what `function` returned (None if it raised), and the process' profiling
+    numbers for this game (if profiling).
+    """
+    profiler = profiling.current()
+    if profiler is not None:
+        # Only send back this game's numbers
+        profiler = profiling.enable()
+
+    output = io.StringIO()
+    result = None
+    with contextlib.redirect_stdout(output):
+        try:
+            result = function(*args)
+        except Exception as e:
+            print(f"Exception analysing game {name}: {e}")
+    return output.getvalue(), result, profiler.snapshot() if profiler is not None else None
+
+
+def run_batch(
+    jobs: List[Tuple[str, Callable[..., Any], Tuple]],
+    processes: int,
+    cookie: Dict,
+    cache: Optional[TurnCache],
+    rate: Optional[float],
+    workers: int,
+    setup: Optional[Callable[[Worker], None]] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Run each `(name, function, args)` job in one of `processes` processes.
+    As each game finishes, its output is printed, and `(name, result)` given
+    back - the result is None if the game raised. Functions (and `setup`) must
+    be defined at the top level of a module, so other processes can find them.
+    """
+    # Only batches need multiprocessing - leave it out of everyone's startup
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # Share the rate limit between all of the processes
+    process_rate = rate / processes if rate else None
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=init_worker,
+        initargs=(
+            cookie,
+            cache.path if cache is not None else None,
+            cache.max_bytes if cache is not None else 0,
+            process_rate,
+            workers,
+            profiling.current() is not None,
+            setup,
+        ),
+    ) as executor:
+        futures = {executor.submit(run_quietly, name, function, args): name for name, function, args in jobs}
+        for future in as_completed(futures):
+            output, result, snapshot = future.result()
+            print(output, end="")
+            if snapshot is not None:
+                profiling.current().merge(snapshot)
+            yield futures[future], result
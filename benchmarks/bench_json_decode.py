@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Decoding (and caching) the biggest late-game turns: the old `response.json()`
+path against `json_codec`, which uses orjson when it's installed. Uses the
+benchmark fixtures, plus any archives given on the command line.
+"""
+
+from typing import Dict, List, Tuple
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import zlib
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import json_codec
+from fixtures import ensure_fixtures
+from replay_archive import ReplayArchive, find_archives
+
+
+def biggest_turns(paths: List[str], count: int) -> List[Tuple[str, int, bytes]]:
+    """
+    The `count` largest turns, as (archive, turn, response body).
+    """
+    turns = []
+    for path in paths:
+        with ReplayArchive(path) as archive:
+            for turn, turn_json in archive.turns():
+                turns.append((os.path.basename(path), turn, json.dumps(turn_json).encode()))
+    return sorted(turns, key=lambda turn: -len(turn[2]))[:count]
+
+
+def response_for(body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = body
+    return response
+
+
+def best(function, number: int, repeat: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def measure(body: bytes, number: int, repeat: int) -> Dict[str, float]:
+    turn_json = json.loads(body)
+    response = response_for(body)
+
+    old_decode = best(lambda: response.json(), number, repeat)
+    new_decode = best(lambda: json_codec.loads(response.content), number, repeat)
+    # The cache used to encode the decoded turn again before compressing it
+    old_store = best(lambda: zlib.compress(json.dumps(turn_json, separators=(",", ":")).encode()), number, repeat)
+    new_store = best(lambda: zlib.compress(body), number, repeat)
+
+    return {
+        "bytes": len(body),
+        "response_json_ms": round(old_decode * 1000, 4),
+        "json_codec_ms": round(new_decode * 1000, 4),
+        "decode_speedup": round(old_decode / new_decode, 2),
+        "old_cache_write_ms": round(old_store * 1000, 4),
+        "cache_write_ms": round(new_store * 1000, 4),
+        "cache_write_speedup": round(old_store / new_store, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decoding of large replay turns.")
+    parser.add_argument("paths", nargs="*", help="Extra archives, or directories of archives.")
+    parser.add_argument("--turns", type=int, default=5, help="How many of the largest turns to use.")
+    parser.add_argument("--number", type=int, default=50, help="Decodes per repeat.")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeats - the best one is reported.")
+    args = parser.parse_args()
+
+    paths = list(ensure_fixtures().values()) + find_archives(args.paths)
+    results = []
+    for archive, turn, body in biggest_turns(paths, args.turns):
+        result = {"archive": archive, "turn": turn}
+        result.update(measure(body, args.number, args.repeat))
+        results.append(result)
+
+    print(json.dumps({"benchmark": "json_decode", "backend": json_codec.BACKEND, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+How long the tools take to start: `--help`, and a build order served entirely
+from the turn cache, with and without a saved session (without one, every run
+starts with a round trip to log in). Runs against the local stub server.
+"""
+
+from typing import Dict, List
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fixtures import GAMES, USERNAME, ensure_fixtures
+from stub_server import StubServer
+
+
+def time_runs(command: List[str], env: Dict[str, str], repeat: int, server: StubServer, before=None) -> Dict:
+    times = []
+    requests_before = server.requests
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return {
+        "best_seconds": round(min(times), 4),
+        "median_seconds": round(statistics.median(times), 4),
+        "requests_per_run": (server.requests - requests_before) / repeat,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startup time of the command line tools.")
+    parser.add_argument("--game", choices=sorted(GAMES), default=sorted(GAMES)[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every stub server request, like a real round trip.")
+    args = parser.parse_args()
+
+    paths = ensure_fixtures()
+    server = StubServer(list(paths.values()), latency=args.latency).start()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        creds_path = os.path.join(tmp, "creds.json")
+        session_path = os.path.join(tmp, "session.json")
+        cache_path = os.path.join(tmp, "turns.sqlite3")
+        with open(creds_path, "w") as f:
+            json.dump({"awbw_username": USERNAME, "awbw_password": "*stub"}, f)
+        env = dict(os.environ, AWBW_BASE_URL=server.base_url, AWBW_CREDS=creds_path, AWBW_SESSION=session_path)
+
+        build_order = [sys.executable, os.path.join(ROOT, "build_order_analyser.py")]
+        player = [sys.executable, os.path.join(ROOT, "player_analyser.py")]
+        game = [str(GAMES[args.game][0]), "--cache-path", cache_path, "--rate", "0"]
+
+        results["python_startup"] = time_runs([sys.executable, "-c", "pass"], env, args.repeat, server)
+        results["build_order_help"] = time_runs(build_order + ["--help"], env, args.repeat, server)
+        results["player_help"] = time_runs(player + ["--help"], env, args.repeat, server)
+
+        # Fill the cache (and save a session)
+        subprocess.run(build_order + game, env=env, stdout=subprocess.DEVNULL, check=True)
+
+        def forget_session() -> None:
+            if os.path.exists(session_path):
+                os.remove(session_path)
+
+        results["cached_game_no_session"] = time_runs(build_order + game, env, args.repeat, server, forget_session)
+        results["cached_game_saved_session"] = time_runs(build_order + game, env, args.repeat, server)
+
+    server.stop()
+    print(json.dumps({"benchmark": "startup", "game": args.game, "latency": args.latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+How much disk and memory delta-encoded gameStates save, compared to keeping
+every turn's full response. Measures the benchmark fixtures, plus any archives
+given on the command line (e.g: real games from `replay_archive.py download`).
+"""
+
+from typing import Dict, List
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fixtures import ensure_fixtures
+from replay_archive import KEYFRAME_INTERVAL, ReplayArchive, find_archives, write_archive
+
+
+def held_bytes(load) -> int:
+    """
+    Memory still allocated after `load()`, while its result is kept alive.
+    """
+    tracemalloc.start()
+    result = load()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return held
+
+
+def measure(path: str, keyframe_interval: int) -> Dict:
+    with ReplayArchive(path) as archive:
+        game_id = archive.game_id
+        raw = [json.dumps(turn_json, separators=(",", ":")) for _, turn_json in archive.turns()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full_path = os.path.join(tmp, "full.awbwreplay")
+        delta_path = os.path.join(tmp, "delta.awbwreplay")
+        write_archive(full_path, game_id, (json.loads(turn) for turn in raw), keyframe_interval=1)
+        write_archive(delta_path, game_id, (json.loads(turn) for turn in raw), keyframe_interval=keyframe_interval)
+
+        result = {
+            "archive": os.path.basename(path),
+            "turns": len(raw),
+            "raw_json_bytes": sum(len(turn) for turn in raw),
+            "full_archive_bytes": os.path.getsize(full_path),
+            "delta_archive_bytes": os.path.getsize(delta_path),
+        }
+
+        # Every turn held in memory at once, e.g: for an analysis that looks
+        # back at earlier turns. Rebuilt turns share their unchanged parts.
+        def load_all(archive_path: str) -> List[Dict]:
+            with ReplayArchive(archive_path) as archive:
+                return [turn_json for _, turn_json in archive.turns()]
+
+        result["full_memory_bytes"] = held_bytes(lambda: load_all(full_path))
+        result["delta_memory_bytes"] = held_bytes(lambda: load_all(delta_path))
+
+        for label, archive_path in (("full", full_path), ("delta", delta_path)):
+            with ReplayArchive(archive_path) as archive:
+                start = time.perf_counter()
+                for _ in archive.turns():
+                    pass
+                result[f"{label}_read_all_seconds"] = round(time.perf_counter() - start, 6)
+
+                # Jumping around costs up to a keyframe interval of diffs each
+                start = time.perf_counter()
+                for turn in range(len(archive) - 1, -1, -1):
+                    archive.get_turn(turn)
+                result[f"{label}_read_backwards_seconds"] = round(time.perf_counter() - start, 6)
+
+    result["disk_saved"] = round(1 - result["delta_archive_bytes"] / result["full_archive_bytes"], 3)
+    result["memory_saved"] = round(1 - result["delta_memory_bytes"] / result["full_memory_bytes"], 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure delta-encoded gameState storage against full snapshots.")
+    parser.add_argument("paths", nargs="*", help="Extra archives, or directories of archives.")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL)
+    args = parser.parse_args()
+
+    paths = list(ensure_fixtures().values()) + find_archives(args.paths)
+    results = [measure(path, args.keyframe_interval) for path in paths]
+    print(json.dumps({"benchmark": "state_delta", "keyframe_interval": args.keyframe_interval, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for `Unit` construction, which `get_units_on_turn` does
+thousands of times per game. Compares against the original implementation,
+which called `fields()` and rebuilt the cost table for every unit.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_objects import Player, Unit, load_unit_costs
+
+
+@dataclass
+class LegacyUnit:
+    units_id: int
+    units_games_id: int
+    units_players_id: int
+    units_name: str
+    units_movement_points: int
+    units_vision: int
+    units_fuel: int
+    units_fuel_per_turn: int
+    units_sub_dive: str
+    units_ammo: int
+    units_short_range: int
+    units_long_range: int
+    units_second_weapon: str
+    units_cost: int
+    units_movement_type: str
+    units_x: int
+    units_y: int
+    units_moved: int
+    units_capture: int
+    units_fired: int
+    units_hit_points: int
+    units_cargo1_units_id: int
+    units_cargo2_units_id: int
+    units_carried: str
+    countries_code: str
+    units_symbol: Optional[str] = None
+    generic_id: Optional[int] = None
+    player_name: Optional[str] = None
+    turn_built: Optional[int] = None
+    extra_distance: Optional[int] = None
+    last_seen_turn: Optional[int] = None
+
+    def __init__(self, players: Dict[int, Player], **kwargs: Any) -> None:
+        valid_fields = {f.name for f in fields(self.__class__)}
+        for field in valid_fields:
+            setattr(self, field, None)
+        for key, value in kwargs.items():
+            if key in valid_fields:
+                setattr(self, key, value)
+        self.player_name = players[self.units_players_id].users_username
+        self.__fix_unit_cost__()
+
+    def __fix_unit_cost__(self) -> None:
+        lookup = {
+            "black boat": 7500, "piperunner": 20000, "black bomb": 25000, "infantry": 1000, "mech": 3000,
+            "md.tank": 16000, "tank": 7000, "recon": 4000, "apc": 5000, "artillery": 6000, "rocket": 15000,
+            "anti-air": 8000, "missile": 12000, "fighter": 20000, "bomber": 22000, "b-copter": 9000,
+            "t-copter": 5000, "battleship": 28000, "cruiser": 18000, "lander": 12000, "sub": 20000,
+            "neotank": 22000, "mega tank": 28000, "carrier": 30000, "stealth": 24000,
+        }
+        if not self.units_cost and self.units_name:
+            self.units_cost = lookup.get(self.units_name.lower(), 0)
+
+
+def sample_player() -> Player:
+    return Player(
+        users_username="someone", users_id=1, players_id=1, players_team=None, players_countries_id=1,
+        players_eliminated="N", players_co_id=1, co_name="Adder", co_image_path=None,
+        co_grayscale_image_path=None, co_max_power=None, co_max_spower=None, players_co_power=0,
+        players_co_power_on="N", players_co_max_power=None, players_co_max_spower=None, players_co_image=None,
+        players_funds=0, countries_code="os", countries_name="Orange Star", numProperties=0, cities=0, labs=0,
+        towers=0, other_buildings=0, players_turn_clock=0, players_turn_start=None, players_order=1,
+    )
+
+
+def sample_unit_json(cost: int) -> Dict[str, Any]:
+    """
+    A unit as it appears in load_replay.php, including keys Unit ignores.
+    """
+    return {
+        "units_id": 123456, "units_games_id": 1, "units_players_id": 1, "units_name": "Tank",
+        "units_movement_points": 6, "units_vision": 3, "units_fuel": 70, "units_fuel_per_turn": 0,
+        "units_sub_dive": "N", "units_ammo": 9, "units_short_range": 0, "units_long_range": 0,
+        "units_second_weapon": "Y", "units_cost": cost, "units_movement_type": "T", "units_x": 4, "units_y": 7,
+        "units_moved": 0, "units_capture": 0, "units_fired": 0, "units_hit_points": 10,
+        "units_cargo1_units_id": 0, "units_cargo2_units_id": 0, "units_carried": "N", "countries_code": "os",
+        "units_symbol": "", "generic_id": 2, "units_hit_points_display": 10, "units_sprite": "ostank.gif",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Unit construction throughput.")
+    parser.add_argument("--number", type=int, default=100000, help="Units constructed per repeat.")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeats - the best one is reported.")
+    args = parser.parse_args()
+
+    players = {1: sample_player()}
+    unit_costs = load_unit_costs(None)
+    results = {}
+
+    # A unit that moved out of vision has no cost, so takes the lookup path too
+    for label, cost in (("with_cost", 7000), ("missing_cost", None)):
+        data = sample_unit_json(cost)
+        legacy = min(timeit.repeat(lambda: LegacyUnit(**data, players=players), number=args.number, repeat=args.repeat))
+        current = min(timeit.repeat(
+            lambda: Unit(**data, players=players, unit_costs=unit_costs), number=args.number, repeat=args.repeat,
+        ))
+        results[label] = {
+            "legacy_units_per_sec": args.number / legacy,
+            "units_per_sec": args.number / current,
+            "speedup": legacy / current,
+        }
+
+    legacy_unit = LegacyUnit(**sample_unit_json(7000), players=players)
+    results["bytes_per_unit"] = {
+        "legacy": sys.getsizeof(legacy_unit) + sys.getsizeof(legacy_unit.__dict__),
+        "current": sys.getsizeof(Unit(**sample_unit_json(7000), players=players)),
+    }
+
+    print(json.dumps({"benchmark": "unit_construction", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Replay fixtures for the benchmarks.
+
+Real games can be recorded with `replay_archive.py download` and dropped into
+the fixtures directory. Any game that hasn't been recorded is generated here
+instead: a deterministic, fog-of-war two player game with the same shape as a
+load_replay.php response.
+"""
+
+from typing import Any, Dict, List
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_objects import UNIT_COSTS
+from replay_archive import archive_path, write_archive
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+USERNAME = "benchmark-player"
+OPPONENT = "benchmark-opponent"
+
+# name: (game_id, turns, starting funds, income per property, builds per turn)
+GAMES = {
+    "short": (900001, 16, 0, 1000, 2),
+    "long": (900002, 90, 0, 1000, 3),
+    "high_funds": (900003, 40, 50000, 3000, 12),
+}
+
+BUILDABLE = ["Infantry", "Mech", "Recon", "Tank", "Artillery", "Anti-Air", "B-Copter", "Md.Tank", "Rocket"]
+
+
+def player_json(players_id: int, username: str, order: int, funds: int, income: int) -> Dict[str, Any]:
+    return {
+        "users_username": username, "users_id": players_id * 10, "players_id": players_id,
+        "players_team": str(players_id), "players_countries_id": order, "players_eliminated": "N",
+        "players_co_id": 1, "co_name": "Sonja" if order == 1 else "Adder", "co_image_path": "sonja.png",
+        "co_grayscale_image_path": "sonja-gs.png", "co_max_power": 270000, "co_max_spower": 450000,
+        "players_co_power": 0, "players_co_power_on": "N", "players_co_max_power": 270000,
+        "players_co_max_spower": 450000, "players_co_image": "sonja.png", "players_funds": funds,
+        "countries_code": "os" if order == 1 else "bm", "countries_name": "Orange Star" if order == 1 else "Blue Moon",
+        "numProperties": income // 1000, "cities": income // 1000 - 1, "labs": 0, "towers": 0, "other_buildings": 0,
+        "players_turn_clock": 86400, "players_turn_start": "2024-01-01 00:00:00", "players_order": order,
+        "players_income": income,
+    }
+
+
+def unit_json(game_id: int, units_id: int, players_id: int, name: str, x: int, y: int) -> Dict[str, Any]:
+    return {
+        "units_id": units_id, "units_games_id": game_id, "units_players_id": players_id, "units_name": name,
+        "units_movement_points": 6, "units_vision": 2, "units_fuel": 70, "units_fuel_per_turn": 0,
+        "units_sub_dive": "N", "units_ammo": 9, "units_short_range": 0, "units_long_range": 0,
+        "units_second_weapon": "N", "units_cost": UNIT_COSTS[name.lower()], "units_movement_type": "T",
+        "units_x": x, "units_y": y, "units_moved": 0, "units_capture": 0, "units_fired": 0,
+        "units_hit_points": 10, "units_cargo1_units_id": 0, "units_cargo2_units_id": 0, "units_carried": "N",
+        "countries_code": "os", "units_symbol": "", "generic_id": BUILDABLE.index(name) + 1,
+    }
+
+
+def generate_game(game_id: int, turns: int, funds: int, income: int, builds: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed or game_id)
+    size = 30
+    players = {
+        1: player_json(1, USERNAME, 1, funds, income),
+        2: player_json(2, OPPONENT, 2, funds, income),
+    }
+    units: Dict[int, Dict] = {}
+    next_id = 1000
+    properties = {1: income // 1000, 2: income // 1000}
+    replay = []
+
+    for turn in range(turns):
+        pid = 1 if turn % 2 == 0 else 2
+        enemy = 3 - pid
+        player = players[pid]
+        player["players_income"] = properties[pid] * 1000
+        player["players_funds"] += player["players_income"]
+
+        # Start of turn: my units, and the enemy units my units can see
+        visible = {
+            str(unit_id): dict(unit) for unit_id, unit in units.items()
+            if unit["units_players_id"] == pid or rng.random() < 0.35
+        }
+        game_state = {
+            "players": {str(p["players_id"]): dict(p) for p in players.values()},
+            "units": visible,
+            "currentTurnPId": pid,
+            "day": turn // 2 + 1,
+        }
+
+        actions = []
+        mine = [unit for unit in units.values() if unit["units_players_id"] == pid]
+        for unit in rng.sample(mine, min(len(mine), 8)):
+            path = [{"x": unit["units_x"], "y": unit["units_y"], "unit_visible": True}]
+            for _ in range(rng.randint(1, 4)):
+                unit["units_x"] = min(size - 1, max(0, unit["units_x"] + rng.choice((-1, 0, 1))))
+                unit["units_y"] = min(size - 1, max(0, unit["units_y"] + rng.choice((-1, 0, 1))))
+                path.append({"x": unit["units_x"], "y": unit["units_y"], "unit_visible": True})
+            actions.append({"action": "Move", "unit": dict(unit), "path": path, "dist": len(path) - 1, "trapped": False})
+
+            if unit["units_name"] == "Infantry" and rng.random() < 0.3:
+                properties[pid] += 1
+                actions.append({"action": "Capt", "buildingInfo": {
+                    "buildings_capture": 20, "terrain_name": "City", "buildings_players_id": pid,
+                }})
+
+        targets = [unit for unit in units.values() if unit["units_players_id"] == enemy]
+        for attacker in rng.sample(mine, min(len(mine), 2)):
+            if not targets:
+                break
+            defender = rng.choice(targets)
+            defender["units_hit_points"] = max(0, defender["units_hit_points"] - rng.randint(1, 6))
+            attacker["units_hit_points"] = max(1, attacker["units_hit_points"] - rng.randint(0, 2))
+            actions.append({
+                "action": "Fire",
+                "attacker": {"units_id": attacker["units_id"], "units_hit_points": attacker["units_hit_points"]},
+                "defender": {"units_id": defender["units_id"], "units_hit_points": defender["units_hit_points"]},
+                "copValues": {"attacker": {"playerId": pid}, "defender": {"playerId": enemy}},
+            })
+            if defender["units_hit_points"] == 0:
+                del units[defender["units_id"]]
+                targets.remove(defender)
+
+        for _ in range(builds):
+            name = "Infantry" if turn < 6 else rng.choice(BUILDABLE)
+            cost = UNIT_COSTS[name.lower()]
+            if player["players_funds"] < cost:
+                break
+            player["players_funds"] -= cost
+            next_id += rng.randint(1, 3)
+            unit = unit_json(game_id, next_id, pid, name, rng.randrange(size), rng.randrange(size))
+            units[next_id] = unit
+            actions.append({"action": "Build", "newUnit": dict(unit)})
+
+        replay.append({"gameState": game_state, "actions": actions})
+
+    return replay
+
+
+def ensure_fixtures(directory: str = FIXTURES_DIR) -> Dict[str, str]:
+    """
+    Make sure every benchmark game has an archive, generating any that are
+    missing. Returns the archive path of each game.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, (game_id, turns, funds, income, builds) in GAMES.items():
+        path = archive_path(directory, str(game_id))
+        if not os.path.exists(path):
+            write_archive(path, str(game_id), generate_game(game_id, turns, funds, income, builds))
+        paths[name] = path
+    return paths
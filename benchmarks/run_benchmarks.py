@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Times the analysers against the local stub server, so it needs no network
+access. Results are printed (or saved) as JSON, and can be compared against an
+earlier run to catch regressions:
+
+    ./benchmarks/run_benchmarks.py --output baseline.json
+    ./benchmarks/run_benchmarks.py --baseline baseline.json
+"""
+
+from typing import Any, Callable, Dict, List
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fixtures import GAMES, USERNAME, ensure_fixtures
+from replay_archive import ReplayArchive
+from stub_server import StubServer
+
+
+def best_of(repeat: int, run: Callable[[], Any]) -> float:
+    """
+    Fastest of `repeat` runs, in seconds, with the tool's output thrown away.
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmarks(args: argparse.Namespace, paths: Dict[str, str], server: StubServer) -> List[Dict]:
+    # Only importable once AWBW_BASE_URL points at the stub server
+    import build_order_analyser
+    import player_analyser
+    import session
+    from transport import Transport, set_default_transport
+
+    def transport() -> Transport:
+        return Transport(rate=None, backoff=0.01)
+
+    results = []
+
+    def record(benchmark: str, game: str, seconds: float, **extra: Any) -> None:
+        result = {"benchmark": benchmark, "game": game, "seconds": round(seconds, 6), **extra}
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    for game in args.games:
+        game_id = str(GAMES[game][0])
+
+        for workers in args.workers:
+            requests_before = server.requests
+            seconds = best_of(args.repeat, lambda: build_order_analyser.Analyser(
+                game_id, workers=workers, transport=transport(),
+            ).find_unit_production_days(only_enemy=False))
+            record(
+                "find_unit_production_days", game, seconds, workers=workers,
+                requests=(server.requests - requests_before) // args.repeat,
+            )
+
+            player_analyser.cookie = session.load_creds()
+            player_analyser.cache = None
+            set_default_transport(transport())
+            requests_before = server.requests
+            seconds = best_of(args.repeat, lambda: player_analyser.analyse_game(game_id, USERNAME, args.turns, workers))
+            record(
+                "analyse_game", game, seconds, workers=workers, turns=args.turns,
+                requests=(server.requests - requests_before) // args.repeat,
+            )
+
+        # Parsing only - every turn is already in memory
+        with ReplayArchive(paths[game]) as archive:
+            turns = list(archive.turns())
+        units = 0
+
+        def parse_all() -> None:
+            nonlocal units
+            analyser = build_order_analyser.Analyser(game_id, archive=archive)
+            units = sum(len(analyser.get_units_on_turn(turn, turn_json)) for turn, turn_json in turns)
+
+        seconds = best_of(args.repeat, parse_all)
+        record(
+            "get_units_on_turn", game, seconds, turns=len(turns), units=units,
+            units_per_sec=round(units / seconds),
+        )
+
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> List[str]:
+    """
+    Every result that got more than `threshold` slower than the baseline.
+    """
+    def key(result: Dict) -> tuple:
+        return (result["benchmark"], result["game"], result.get("workers"))
+
+    with open(baseline_path) as f:
+        baseline = {key(result): result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        before = baseline.get(key(result))
+        if before and result["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append(
+                f"{result['benchmark']} {result['game']} (workers={result.get('workers')}): "
+                f"{before['seconds']:.4f}s -> {result['seconds']:.4f}s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysers against a local stub server.")
+    parser.add_argument("--games", nargs="+", choices=list(GAMES), default=list(GAMES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4], help="Worker counts to try.")
+    parser.add_argument("--turns", type=int, default=12, help="Turns per game for analyse_game.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark - the fastest is reported.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds of server latency per request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this much extra latency, at random.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with a 500.")
+    parser.add_argument("--output", help="Save the results here, as well as printing them.")
+    parser.add_argument("--baseline", help="Earlier results to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown that counts as a regression.")
+    args = parser.parse_args()
+
+    paths = ensure_fixtures()
+    server = StubServer(list(paths.values()), latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    server.start()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as creds, tempfile.TemporaryDirectory() as session_dir:
+        json.dump({"awbw_username": USERNAME, "awbw_password": "*stub"}, creds)
+        creds.flush()
+        os.environ["AWBW_BASE_URL"] = server.base_url
+        os.environ["AWBW_CREDS"] = creds.name
+        # Don't replace the real saved session with the stub server's
+        os.environ["AWBW_SESSION"] = os.path.join(session_dir, "session.json")
+
+        try:
+            results = run_benchmarks(args, paths, server)
+        finally:
+            server.stop()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the parts of AWBW the tools use, serving games from
+replay archives:
+
+    GET  /                              Sets a PHPSESSID cookie
+    POST /api/game/load_replay.php      Turns from the archives
+    GET  /gamescompleted.php            Every archived game, 50 per page
+
+Latency and errors can be injected, to see how the tools behave against a slow
+or flaky server.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from replay_archive import ReplayArchive, find_archives
+
+
+PAGE_SIZE = 50
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        archive_paths: list,
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.archives: Dict[str, ReplayArchive] = {}
+        for path in archive_paths:
+            archive = ReplayArchive(path)
+            self.archives[archive.game_id] = archive
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        for archive in self.archives.values():
+            archive.close()
+
+    def delay_and_maybe_fail(self) -> bool:
+        """
+        Wait for the configured latency. Returns True if this request should
+        fail with a 500.
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        return fail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    server: StubServer
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately - don't wait for an ACK between
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: Optional[Dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server._lock:
+            self.server.bytes_sent += len(body)
+
+    def do_GET(self) -> None:
+        if self.server.delay_and_maybe_fail():
+            return self.send_body(500, b"Injected error", "text/plain")
+
+        url = urlparse(self.path)
+        if url.path == "/":
+            return self.send_body(200, b"<html></html>", "text/html", {"Set-Cookie": "PHPSESSID=stub; Path=/"})
+        if url.path == "/gamescompleted.php":
+            start = int(parse_qs(url.query).get("start", ["1"])[0])
+            game_ids = sorted(self.server.archives, reverse=True)[start - 1:start - 1 + PAGE_SIZE]
+            links = "".join(f'<a href="game.php?games_id={game_id}&amp;ndx=0">{game_id}</a>\n' for game_id in game_ids)
+            return self.send_body(200, f"<html><body>{links}</body></html>".encode(), "text/html")
+
+        self.send_body(404, b"Not found", "text/plain")
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.server.delay_and_maybe_fail():
+            return self.send_body(500, b"Injected error", "text/plain")
+
+        if urlparse(self.path).path != "/api/game/load_replay.php":
+            return self.send_body(404, b"Not found", "text/plain")
+
+        archive = self.server.archives.get(str(body.get("gameId")))
+        try:
+            if archive is None:
+                raise RuntimeError("Game not found")
+            response = archive.get_turn(int(body.get("turn", 0)))
+        except RuntimeError as e:
+            response = {"err": True, "message": str(e)}
+        self.send_body(200, json.dumps(response).encode(), "application/json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve replay archives like AWBW's replay API.")
+    parser.add_argument("paths", nargs="+", help="Archives, or directories of archives.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many more seconds, at random.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with a 500.")
+    args = parser.parse_args()
+
+    server = StubServer(find_archives(args.paths), args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Serving {len(server.archives)} games on {server.base_url} - set AWBW_BASE_URL to use it")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,121 @@
 #!/usr/bin/env python3
 
-from typing import Any, Dict, List
-from data_objects import Player, Unit
-from dataclasses import fields
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from action_pipeline import ANY_ACTION, ActionPipeline, Analysis, Captures, CombatDamage, UnitsBuilt, current_day, current_player
+from awbw_api import TurnLoader, fetch_turns, get_turn_count, load_replay
+from data_objects import Player, Unit, load_unit_costs
+from replay_archive import ReplayArchive, find_archives
+from session import get_cookie, load_creds
+from dataclasses import asdict, fields
+from export import BUILD_ORDER_FIELDS, ListWriter, RecordWriter, open_writer
+from funds_ledger import FundsLedger
+from transport import DEFAULT_RATE, Transport, default_transport
+from turn_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, TurnCache
+from unit_timeline import TIMELINE_FIELDS, UnitTimeline
 
 import argparse
+import batch
+import contextlib
+import itertools
 import json
 import logging
 import os
-import requests
+import profiling
+import re
 import sys
 import time
 
 
 logger = logging.getLogger(__name__)
 
+# Be nice to the AWBW server
+DEFAULT_WORKERS = 4
 
-def get_cookie() -> str:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    cookie = json.load(open(script_dir + "/creds.json"))
-    if cookie.get("awbw_password") is None:
-        raise RuntimeError("Please get a password using F12 dev tools. It should start with '%2A' or '*', followed by 40 hex characters.")
+# Stands in for the first unit ID of a turn where nothing was built
+NO_BUILDS = 2 ** 64
 
-    # Get the PHPSESSID cookie - If we don't have it, 'units' is empty
-    response = requests.get(
-        "https://awbw.amarriner.com/",
-        cookies=cookie,
-    )
-
-    for resp_cookie in response.cookies:
-        cookie[resp_cookie.name] = resp_cookie.value
+WATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "watch")
 
-    return cookie
 
-
-class Analyser():
+class Analyser(Analysis):
 
     cookie = None
     game_id: int
     players: Dict[int, Player] = {}
+    # players_id of each player, in turn order
+    seats: List[int] = []
     me: Player
-
-    def __init__(self, game_id: str, debug: bool=False):
-        self.game_id = game_id
-        self.cookie = get_cookie()
+    unit_costs: Optional[Dict[str, int]] = None
+    show_progress: bool = True
+    timeline: Optional[UnitTimeline] = None
+
+    def __init__(
+        self,
+        game_id: Optional[str],
+        debug: bool=False,
+        cache: Optional[TurnCache]=None,
+        workers: int=DEFAULT_WORKERS,
+        transport: Optional[Transport]=None,
+        archive: Optional[ReplayArchive]=None,
+        cookie: Optional[Dict]=None,
+        load: Optional[TurnLoader]=None,
+        timeline: Optional[UnitTimeline]=None,
+    ):
+        self.archive = archive
         self.debug = debug
+        self.cache = cache
+        self.workers = workers
+        self.transport = transport or default_transport()
+        self.load = load
+        # Every sighting of every unit, if the caller wants more than the newest
+        self.timeline = timeline
+
+        # Units seen on the turn being fed through the pipeline
+        self.units: Dict[int, Unit] = {}
+        # Who played each turn that was analysed (players_id), and on which day
+        self.turn_players: Dict[int, int] = {}
+        self.turn_days: Dict[int, int] = {}
+        self.pipeline = ActionPipeline([self])
+
+        if archive is not None:
+            # Everything is on disk - we only need to know who I am
+            self.game_id = archive.game_id
+            self.cookie = load_creds(require_password=False)
+        else:
+            self.game_id = game_id
+            # A long-running caller can log in once, and reuse the cookie
+            self.cookie = cookie or get_cookie(self.transport)
 
     def get_turn_json(self, turn: int) -> Dict:
-        body = {
-            "gameId": self.game_id,
-            "turn": turn,
-            "initial": True,  # Don't know what this does
-        }
-
-        response = requests.post(
-            "https://awbw.amarriner.com/api/game/load_replay.php",
-            cookies=self.cookie,
-            json=body,
-        )
+        if self.archive is not None:
+            return self.archive.get_turn(turn)
+        load = self.load or load_replay
+        return load(self.game_id, turn, self.cookie, self.cache, self.transport)
 
-        if response.status_code != 200:
-            raise Exception(f"Got bad response code: {response.status_code}")
-        if "err" in response.json():
-            raise RuntimeError(response.json()["message"])
+    def fetch_turns(self, turns: Iterable[int], workers: Optional[int]=None) -> Iterator[Tuple[int, Dict]]:
+        if self.archive is not None:
+            return ((turn, self.archive.get_turn(turn)) for turn in turns)
+        return fetch_turns(self.game_id, turns, self.cookie, self.cache, self.transport, workers or self.workers, self.load)
 
-        return response.json()
+    def get_turn_count(self, known_turn: int=0) -> int:
+        if self.archive is not None:
+            return len(self.archive)
+        return get_turn_count(self.game_id, self.cookie, self.cache, self.transport, known_turn, load=self.load)
 
     def get_players(self, player_dict: dict[int, dict]) -> Dict[int, Player]:
         """
         FIXME - actually make a call here, and do it early, not in getunits
         """
         players = list(Player(**data) for data in player_dict.values())
-        # We don't support 3+ players
-        assert len(players) == 2
 
-        # Find out who is first
-        if players[0].players_order < players[1].players_order:
-            players[0].first = True
-            players[1].first = False
-        else:
-            players[0].first = False
-            players[1].first = True
+        # Find out who is first, and the turn order
+        self.seats = [player.players_id for player in sorted(players, key=lambda player: player.players_order)]
+        for player in players:
+            player.first = player.players_id == self.seats[0]
 
-        # Find out who I am
-        if players[0].users_username.lower() == self.cookie.get("awbw_username").lower():
-            self.me = players[0]
-        else:
-            self.me = players[1]
+        # Find out who I am (the last player, if I'm not in the game)
+        username = self.cookie.get("awbw_username").lower()
+        self.me = next((player for player in players if player.users_username.lower() == username), players[-1])
 
         # Convert to a dict for easy searching
         players = {player.players_id: player for player in players}
@@ -94,130 +123,253 @@ class Analyser():
         # current_player = players[turn_json["gameState"]["currentTurnPId"]]
         return players
 
-    def get_units_on_turn(self, turn: int) -> Dict[int, Unit]:
-        units: Dict[int, Unit] = {}
+    def turn_player(self, turn: int) -> int:
+        """
+        Who played a turn (players_id). Known for every turn that was analysed,
+        otherwise worked out from the turn order, which doesn't know about
+        eliminated players. Units that were there before the game began (turn
+        -1) belong to the last player.
+        """
+        players_id = self.turn_players.get(turn)
+        if players_id is None:
+            players_id = self.seats[turn % len(self.seats)]
+        return players_id
+
+    def turn_day(self, turn: int) -> int:
+        """
+        The day a turn was played on. Like `turn_player`, turns that weren't
+        analysed are worked out from the turn order.
+        """
+        day = self.turn_days.get(turn)
+        if day is None:
+            day = turn // len(self.seats) + 1
+        return day
+
+    def day_label(self, turn: int) -> float:
+        """
+        The day, plus how far through it the turn was - with 2 players, 5.0 is
+        the first player's turn on day 5, and 5.5 the second's.
+        """
+        return round(self.turn_day(turn) + self.seats.index(self.turn_player(turn)) / len(self.seats), 2)
 
-        turn_json = self.get_turn_json(turn)
+    def get_units_on_turn(self, turn: int, turn_json: Optional[Dict]=None) -> Dict[int, Unit]:
+        if turn_json is None:
+            turn_json = self.get_turn_json(turn)
 
         if not self.players:
             self.players = self.get_players(turn_json["gameState"]["players"])
+        if self.unit_costs is None:
+            self.unit_costs = load_unit_costs(turn_json["gameState"].get("generic_units"))
+
+        # One pass over the actions feeds every other analysis too
+        self.pipeline.feed(turn, turn_json)
+        return self.units
+
+    def register(self, pipeline: ActionPipeline) -> None:
+        pipeline.on(ANY_ACTION, self.on_discovered)
+        pipeline.on("Build", self.on_build)
+        pipeline.on("Move", self.on_move)
+        pipeline.on("Fire", self.on_fire)
+        pipeline.on("Join", self.on_join)
+        pipeline.on("Unload", self.on_unload)
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        self.units = {}
+        self.turn_players[turn] = current_player(turn_json)
+        self.turn_days[turn] = current_day(turn, turn_json)
+        if self.timeline is not None:
+            self.timeline.start_turn(turn, self.turn_days[turn])
 
         # Parse units that are visible at turn start
         for unit_id, data in turn_json["gameState"]["units"].items():
-            units[int(unit_id)] = Unit(**data, players=self.players)
+            self.units[int(unit_id)] = self.make_unit(data)
             if turn == 0:
                 # Unit was built before the game began
-                units[int(unit_id)].turn_built = -1
-
-        # Parse units that were made visible by actions (move, build, etc)
-        for action in turn_json["actions"]:
-            if action.get("discovered") and "units" in action["discovered"]:
-                for discovered_unit in action["discovered"]["units"]:
-                    discovered_unit = Unit(**discovered_unit, players=self.players)
-                    units[discovered_unit.units_id] = discovered_unit
-
-            if action["action"] == "Build":
-                new_unit = Unit(**action["newUnit"], turn_built=turn, players=self.players)
-                units[int(new_unit.units_id)] = new_unit
-            elif action["action"] == "Move":
-                moving_unit = Unit(**action["unit"], players=self.players)
-                units[int(moving_unit.units_id)] = moving_unit
-
-                if not moving_unit.units_x and not moving_unit.units_y:
-                    # Unit moved out of vision
-                    moving_unit.units_x = action["path"][-1]["x"]
-                    moving_unit.units_y = action["path"][-1]["y"]
-
-                    # HACK - this is impossible information to know
-                    # Technically cheating, but I already told the site admin
-                    # and he doesn't care.
-                    moving_unit.extra_distance = action["dist"] - (len(action["path"]) - 1)
-            elif action["action"] == "Fire":
-                defender = action.get("defender")
-                attacker = action.get("attacker")
-                if attacker == "?":
-                    units[9999999999999] = Unit(units_id=999999999999, units_name="Unknown Artillery", units_players_id=action["copValues"]["attacker"]["playerId"], players=self.players)
-                elif attacker["units_id"] in units:
-                    units[attacker["units_id"]].units_hit_points = attacker["units_hit_points"]
-                if defender["units_id"] in units:
-                    units[defender["units_id"]].units_hit_points = defender["units_hit_points"]
-            elif action["action"] == "Join":
-                joined_unit = Unit(**action["joinedUnit"], players=self.players)
-                units[int(joined_unit.units_id)] = joined_unit
-
-                # Set this unit HP to zero - it's kinda dead?
-                units[action["joinId"]].units_hit_points = 0
-            elif action["action"] == "Unload":
-                unloaded_unit = Unit(**action["unloadedUnit"], players=self.players)
-                units[int(unloaded_unit.units_id)] = unloaded_unit
-
-                # Glitchy - we know the transport ID, but nothing else! Hahaha
-                if action["transportId"] not in units:
-                    # DANGER - STUPID MONKEY CODING HERE
-                    units[int(action["transportId"])] = Unit(
-                        units_id=action["transportId"],
-                        units_name="MYSTERY TRANSPORT",
-                        units_players_id=unloaded_unit.units_players_id,
-                        players=self.players,
-                    )
-
-        return units
-
-    def find_unit_production_days(self, only_enemy: bool) -> None:
-        all_units: Dict[int, Unit] = {}
-        max_turn = 0
-
-        # Get every single unit ever seen
-        for turn in range(0, 100):
-            sys.stdout.write(f"\rGathering data for day {turn / 2 + 1}...")
-            sys.stdout.flush()
-            try:
-                new_units = self.get_units_on_turn(turn)
+                self.units[int(unit_id)].turn_built = -1
+            self.observe(turn, self.units[int(unit_id)], "turn_start")
+
+    def make_unit(self, data: Dict, **kwargs: Any) -> Unit:
+        return Unit(**data, **kwargs, players=self.players, unit_costs=self.unit_costs)
+
+    def observe(self, turn: int, unit: Unit, source: str) -> None:
+        if self.timeline is not None:
+            self.timeline.add(turn, unit, source)
+
+    # Parse units that were made visible by actions (move, build, etc)
+    def on_discovered(self, turn: int, action: Dict) -> None:
+        if action.get("discovered") and "units" in action["discovered"]:
+            for discovered_unit in action["discovered"]["units"]:
+                discovered_unit = self.make_unit(discovered_unit)
+                self.units[discovered_unit.units_id] = discovered_unit
+                self.observe(turn, discovered_unit, "discovered")
+
+    def on_build(self, turn: int, action: Dict) -> None:
+        new_unit = self.make_unit(action["newUnit"], turn_built=turn)
+        self.units[int(new_unit.units_id)] = new_unit
+        self.observe(turn, new_unit, "Build")
+
+    def on_move(self, turn: int, action: Dict) -> None:
+        moving_unit = self.make_unit(action["unit"])
+        self.units[int(moving_unit.units_id)] = moving_unit
+
+        if not moving_unit.units_x and not moving_unit.units_y:
+            # Unit moved out of vision
+            moving_unit.units_x = action["path"][-1]["x"]
+            moving_unit.units_y = action["path"][-1]["y"]
+
+            # HACK - this is impossible information to know
+            # Technically cheating, but I already told the site admin
+            # and he doesn't care.
+            moving_unit.extra_distance = action["dist"] - (len(action["path"]) - 1)
+        self.observe(turn, moving_unit, "Move")
+
+    def on_fire(self, turn: int, action: Dict) -> None:
+        units = self.units
+        defender = action.get("defender")
+        attacker = action.get("attacker")
+        if attacker == "?":
+            units[9999999999999] = Unit(units_id=999999999999, units_name="Unknown Artillery", units_players_id=action["copValues"]["attacker"]["playerId"], players=self.players, unit_costs=self.unit_costs)
+        elif attacker["units_id"] in units:
+            units[attacker["units_id"]].units_hit_points = attacker["units_hit_points"]
+            self.observe(turn, units[attacker["units_id"]], "Fire")
+        if defender["units_id"] in units:
+            units[defender["units_id"]].units_hit_points = defender["units_hit_points"]
+            self.observe(turn, units[defender["units_id"]], "Fire")
+
+    def on_join(self, turn: int, action: Dict) -> None:
+        joined_unit = self.make_unit(action["joinedUnit"])
+        self.units[int(joined_unit.units_id)] = joined_unit
+        self.observe(turn, joined_unit, "Join")
+
+        # Set this unit HP to zero - it's kinda dead?
+        self.units[action["joinId"]].units_hit_points = 0
+        self.observe(turn, self.units[action["joinId"]], "Join")
+
+    def on_unload(self, turn: int, action: Dict) -> None:
+        unloaded_unit = self.make_unit(action["unloadedUnit"])
+        self.units[int(unloaded_unit.units_id)] = unloaded_unit
+        self.observe(turn, unloaded_unit, "Unload")
+
+        # Glitchy - we know the transport ID, but nothing else! Hahaha
+        if action["transportId"] not in self.units:
+            # DANGER - STUPID MONKEY CODING HERE
+            self.units[int(action["transportId"])] = Unit(
+                units_id=action["transportId"],
+                units_name="MYSTERY TRANSPORT",
+                units_players_id=unloaded_unit.units_players_id,
+                players=self.players,
+                unit_costs=self.unit_costs,
+            )
+
+    def gather_units(self, all_units: Dict[int, Unit], first_turn: int=0, workers: Optional[int]=None, strict: bool=False) -> Optional[int]:
+        """
+        Merge every unit seen from `first_turn` onwards into `all_units`.
+        Returns the last turn that was merged, or None if there were no turns.
+        With `strict`, a turn that can't be downloaded after the first raises
+        instead of cutting the results short.
+        """
+        max_turn = None
+
+        # Get every single unit ever seen. Turns may arrive concurrently, but
+        # they are always merged in order.
+        try:
+            turn_count = self.get_turn_count(first_turn)
+            for turn, turn_json in self.fetch_turns(range(first_turn, turn_count), workers):
+                with profiling.phase("get_units_on_turn", turn):
+                    new_units = self.get_units_on_turn(turn, turn_json)
+                # After the turn is read, so we know which day it's on
+                if self.show_progress:
+                    sys.stdout.write(f"\rGathering data for day {self.day_label(turn)}...")
+                    sys.stdout.flush()
+                profiling.count("units", len(new_units), turn)
 
                 # Update units
-                for unit_id, new_unit in new_units.items():
-                    new_unit.last_seen_turn = turn
-                    if unit_id in all_units:
-                        # Preserve turn_built if it already exists
-                        # Stops us from forgetting a unit was built on turn zero
-                        new_unit.turn_built = all_units[unit_id].turn_built
-                    all_units[unit_id] = new_unit
-            except RuntimeError as e:
-                # Normal "healthy" exception (probably no more turns left)
-                print(e)
-                break
-            except Exception as e:
-                logger.exception(e)
-                time.sleep(3)
-                break
-            max_turn = turn
-
-        # Fill in missing data about the enemy units, based on unit ID.
-        # Units with ID's less than one from this turn, and that don't have a
-        # turn already, must have been made on the previous turn
-        turn = -1
-        while turn <= max_turn:
-            units_built_this_turn = {unit_id: data for unit_id, data in all_units.items() if data.turn_built == turn}
-
-            if units_built_this_turn:
-                id_from_this_turn = list(units_built_this_turn.keys())[0]
-            elif turn <= 0:
-                # Wait until you build a unit - that will be your first turn
-                turn += 1
-                continue
+                with profiling.phase("merge", turn):
+                    for unit_id, new_unit in new_units.items():
+                        new_unit.last_seen_turn = turn
+                        if unit_id in all_units:
+                            # Preserve turn_built if it already exists
+                            # Stops us from forgetting a unit was built on turn zero
+                            new_unit.turn_built = all_units[unit_id].turn_built
+                        all_units[unit_id] = new_unit
+                max_turn = turn
+        except RuntimeError as e:
+            if strict and max_turn is not None:
+                raise
+            # The server refused (e.g: the game doesn't exist)
+            print(e)
+        except Exception as e:
+            if strict:
+                raise
+            # Transient errors were already retried by the transport, so this
+            # is a real failure. Show what we have, but don't hide the gap.
+            logger.exception(e)
+            last_turn = first_turn - 1 if max_turn is None else max_turn
+            if self.seats:
+                print(f"\nWARNING: Could not download day {self.day_label(last_turn + 1)}. Results stop at day {self.day_label(last_turn)}.")
             else:
-                # It's probably your turn, and you haven't built yet?
-                # If you somehow didn't build for a turn, this script will break
-                id_from_this_turn = 2 ** 64
+                print("\nWARNING: Could not download the first turn.")
 
-            for unit_id, unit_data in all_units.items():
-                if unit_id < id_from_this_turn and unit_data.turn_built is None:
-                    # Should only happen for opponent units - built last turn
-                    unit_data.turn_built = turn - 1
+        return max_turn
 
-            # Go to MY next turn
-            turn += 2
+    def infer_turn_built(self, all_units: Dict[int, Unit], max_turn: int) -> None:
+        """
+        Fill in missing data about the enemy units, based on unit ID.
 
+        IDs only ever go up, so units with ID's less than the first one built
+        on my turn, and that don't have a turn already, must have been made
+        since my previous turn - on the latest turn their owner played before
+        mine.
+        """
+        if not all_units or not self.seats:
+            return
+
+        # Lowest unit ID built on each turn, and every unit with no known turn
+        first_id_by_turn: Dict[int, int] = {}
+        unknown_ids: List[int] = []
+        for unit_id, unit_data in all_units.items():
+            if unit_data.turn_built is None:
+                unknown_ids.append(unit_id)
+            elif unit_id < first_id_by_turn.get(unit_data.turn_built, NO_BUILDS):
+                first_id_by_turn[unit_data.turn_built] = unit_id
+
+        # Wait until you build a unit - that will be your first turn
+        turn = -1
+        while turn < len(self.seats) - 1 and turn not in first_id_by_turn:
+            turn += 1
+        me = self.turn_player(turn)
+        my_turns = [my_turn for my_turn in range(turn, max_turn + 1) if self.turn_player(my_turn) == me]
+
+        # The latest turn each player had played, as of each turn. Looked up
+        # once per unit, so attributing units never walks the turns again.
+        latest_turns: Dict[int, List[int]] = {players_id: [] for players_id in self.seats}
+        latest = {players_id: -1 for players_id in self.seats}
+        for each_turn in range(max_turn + 1):
+            latest[self.turn_player(each_turn)] = each_turn
+            for players_id, turns in latest_turns.items():
+                turns.append(latest[players_id])
+
+        # A unit was built just before the first of MY turns whose boundary is
+        # above its ID. A running max keeps the boundaries sorted, so a single
+        # walk over the sorted IDs finds that turn for every unit.
+        # If I haven't built yet, it's probably still my turn, so NO_BUILDS
+        # lets every remaining unit through. If you somehow didn't build for a
+        # turn, this will break.
+        boundaries = list(itertools.accumulate((first_id_by_turn.get(t, NO_BUILDS) for t in my_turns), max))
+
+        index = 0
+        for unit_id in sorted(unknown_ids):
+            while index < len(boundaries) and boundaries[index] <= unit_id:
+                index += 1
+            # Should only happen for opponent units - built on their last turn
+            # before that turn of mine (or before now, if after my latest turn)
+            turn_before = (my_turns[index] if index < len(boundaries) else max_turn + 1) - 1
+            owner_turns = latest_turns.get(all_units[unit_id].units_players_id)
+            if owner_turns and turn_before >= 0 and owner_turns[turn_before] >= 0:
+                turn_before = owner_turns[turn_before]
+            all_units[unit_id].turn_built = turn_before
+
+    def print_units(self, all_units: Dict[int, Unit], only_enemy: bool) -> None:
         # Group units by turn, for easy display
         units_by_turn: Dict[int, List[Unit]] = {}
         for unit_data in all_units.values():
@@ -226,26 +378,19 @@ class Analyser():
             units_by_turn[unit_data.turn_built].append(unit_data)
 
         turn = None
-        total_value = {
-            "even": 0,
-            "odd": 0,
-        }
+        total_value: Dict[int, int] = {}  # players_id: value built so far
         for turn, units in sorted(units_by_turn.items()):
-            turn_type = "odd" if turn % 2 else "even"
+            players_id = self.turn_player(turn)
 
-            if only_enemy:
+            if only_enemy and players_id == self.me.players_id:
                 # Only print enemy info
-                # FYI - the first turn is turn zero
-                if self.me.first and turn_type == "even":
-                    continue
-                if not self.me.first and turn_type == "odd":
-                    continue
+                continue
 
             daily_value = sum(unit.units_cost or 0 for unit in units)
-            total_value[turn_type] += daily_value
+            total_value[players_id] = total_value.get(players_id, 0) + daily_value
 
-            print(f"\n=== DAY {(turn / 2) + 1} ({units[0].player_name}) ===")
-            print(f"Total: ${total_value[turn_type]}, (+${daily_value})")
+            print(f"\n=== DAY {self.day_label(turn)} ({units[0].player_name}) ===")
+            print(f"Total: ${total_value[players_id]}, (+${daily_value})")
 
             for unit in units:
                 health = unit.units_hit_points
@@ -255,7 +400,7 @@ class Analyser():
                 if unit.last_seen_turn > max(units_by_turn):
                     last_seen = f"At {unit.units_x}x{unit.units_y}"
                 else:
-                    last_seen = f"Last seen turn {(unit.last_seen_turn / 2) + 1} at {unit.units_x}x{unit.units_y}"
+                    last_seen = f"Last seen turn {self.day_label(unit.last_seen_turn)} at {unit.units_x}x{unit.units_y}"
                 if unit.extra_distance:
                     last_seen += f"+{unit.extra_distance}"
 
@@ -264,19 +409,343 @@ class Analyser():
                     unit_string += f" - {unit.units_id}"
                 print(unit_string)
 
-# TODO - FIND:
-# total money spent on repairs (enemy)
-# total money spent on units (enemy)
-# estimated money earned (entire game)
-# estimated troop value, number, and hidden troops
+    def export_units(self, all_units: Dict[int, Unit], writer: RecordWriter) -> None:
+        """
+        Write one record per unit (mine and the enemy's), in build order.
+        """
+        for unit in sorted(all_units.values(), key=lambda unit: (unit.turn_built, unit.units_id)):
+            writer.write({
+                "game_id": int(self.game_id),
+                "units_id": unit.units_id,
+                "player_name": unit.player_name,
+                "units_players_id": unit.units_players_id,
+                "enemy": unit.units_players_id != self.me.players_id,
+                "units_name": unit.units_name,
+                "units_cost": unit.units_cost,
+                "turn_built": unit.turn_built,
+                "day_built": self.turn_day(unit.turn_built),
+                "last_seen_turn": unit.last_seen_turn,
+                "units_x": unit.units_x,
+                "units_y": unit.units_y,
+                "units_hit_points": unit.units_hit_points,
+            })
+
+    def summarise(self, units_built: UnitsBuilt, captures: Captures, damage: CombatDamage, only_enemy: bool=False) -> Dict[int, Dict[str, Any]]:
+        """
+        What each player (or only my opponents) built, captured and destroyed,
+        from the same pass over the game as the build order.
+        """
+        return {
+            player.players_id: {
+                "username": player.users_username,
+                "units_built": units_built.by_player.get(player.players_id, {}),
+                "captures": sum(captures.by_day.get(player.players_id, {}).values()),
+                "damage_dealt": damage.dealt.get(player.players_id, 0),
+            }
+            for player in self.players.values()
+            if not (only_enemy and player.players_id == self.me.players_id)
+        }
+
+    def print_summary(self, units_built: UnitsBuilt, captures: Captures, damage: CombatDamage, only_enemy: bool=False) -> None:
+        for player in self.summarise(units_built, captures, damage, only_enemy).values():
+            built = player["units_built"]
+            total = sum(built.values())
+            print(f"\n=== SUMMARY ({player['username']}) ===")
+            print(f"Units built: {total}")
+            for unit_name, count in sorted(built.items(), key=lambda item: -item[1]):
+                print(f"  {unit_name}: {count} ({round(count / total * 100, 2)}%)")
+            print(f"Captures: {player['captures']}")
+            print(f"Damage dealt: ${player['damage_dealt']}")
+
+    def print_history(self, unit_id: int) -> None:
+        """
+        Every time a unit was seen, and what showed it. Needs a timeline.
+        """
+        history = self.timeline.history(unit_id)
+        if not history:
+            print(f"\n=== UNIT {unit_id} === Never seen")
+            return
+
+        print(f"\n=== UNIT {unit_id}: {history[0]['units_name']} ({self.players[history[0]['units_players_id']].users_username}) ===")
+        for sighting in history:
+            health = sighting["units_hit_points"]
+            status = "?HP" if health is None else f"{health:g}HP" if health else "DEAD"
+            position = f"{sighting['units_x']}x{sighting['units_y']}"
+            if sighting["extra_distance"]:
+                position += f"+{sighting['extra_distance']}"
+            print(f"  Day {self.day_label(sighting['turn'])} ({sighting['source']}): {status} at {position}")
+
+    def print_ledger(self, ledger: FundsLedger, only_enemy: bool) -> None:
+        for players_id in sorted(ledger.players):
+            if only_enemy and players_id == self.me.players_id:
+                continue
+            report = ledger.report(players_id)
+            if not report:
+                continue
+            print(f"\n=== FUNDS ({report['username']}) ===")
+            print(f"Earned: ${report['earned'][-1]} (income ${report['income']} per day)")
+            print(f"Seen building: ${report['build_spend']}")
+            print(f"Repairs: ${report['repair_spend']}")
+            if report["hidden_army_estimated"]:
+                print(f"Hidden army: at most ${report['hidden_army_value']} spent on units we haven't seen (funds hidden - assumes they saved nothing)")
+            else:
+                print(f"Hidden army: up to ${report['hidden_army_value']} spent on units we haven't seen")
+            earliest = sorted((day, name) for name, day in report["earliest_day"].items() if day is not None)
+            print("Could first afford: " + ", ".join(f"{name} (day {day})" for day, name in earliest))
+
+    def find_unit_production_days(self, only_enemy: bool, writer: Optional[RecordWriter]=None, summary: bool=False, ledger: bool=False) -> None:
+        if summary:
+            units_built = self.pipeline.add(UnitsBuilt())
+            captures = self.pipeline.add(Captures())
+            damage = self.pipeline.add(CombatDamage(self.unit_costs))
+        if ledger:
+            funds = self.pipeline.add(FundsLedger(self.unit_costs))
+
+        all_units: Dict[int, Unit] = {}
+        max_turn = self.gather_units(all_units) or 0
+        if not self.seats:
+            # Not even the first turn could be read - gather_units said why
+            return
+        with profiling.phase("infer_turn_built"):
+            self.infer_turn_built(all_units, max_turn)
+        with profiling.phase("print"):
+            self.print_units(all_units, only_enemy)
+            if summary:
+                self.print_summary(units_built, captures, damage, only_enemy)
+            if ledger:
+                self.print_ledger(funds, only_enemy)
+        if writer is not None:
+            with profiling.phase("export"):
+                self.export_units(all_units, writer)
+
+    def watch(self, only_enemy: bool, interval: int=0, state_path: Optional[str]=None, ledger: bool=False) -> None:
+        """
+        Like `find_unit_production_days`, but remembers what it has already
+        seen, so each run (or each poll, if `interval` is given) only downloads
+        the turns added since last time.
+        """
+        state_path = state_path or os.path.join(WATCH_DIR, f"{self.game_id}.json")
+        all_units, max_turn = self.load_state(state_path)
+        funds = self.pipeline.add(FundsLedger(self.unit_costs)) if ledger else None
+
+        while True:
+            # The newest turn we have may have been in progress - get it again.
+            # The ledger isn't saved, so it needs the whole game once.
+            first_turn = 0 if max_turn is None or (funds is not None and not funds.players) else max_turn
+            before = {unit_id: asdict(unit) for unit_id, unit in all_units.items()}
+            new_max_turn = self.gather_units(all_units, first_turn)
+            if new_max_turn is not None:
+                max_turn = new_max_turn
+
+            if max_turn is not None:
+                # Inference fills in turn_built, so keep what we actually saw
+                observed = {unit_id: unit.turn_built for unit_id, unit in all_units.items()}
+                changed = before != {unit_id: asdict(unit) for unit_id, unit in all_units.items()}
+
+                with profiling.phase("infer_turn_built"):
+                    self.infer_turn_built(all_units, max_turn)
+                if changed or not interval:
+                    with profiling.phase("print"):
+                        self.print_units(all_units, only_enemy)
+                        if funds is not None:
+                            self.print_ledger(funds, only_enemy)
+                self.save_state(state_path, all_units, observed, max_turn)
+
+                for unit_id, unit in all_units.items():
+                    unit.turn_built = observed[unit_id]
+
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def save_state(self, path: str, all_units: Dict[int, Unit], observed: Dict[int, Optional[int]], max_turn: int) -> None:
+        state = {
+            "game_id": self.game_id,
+            "max_turn": max_turn,
+            "me": self.me.players_id,
+            "players": [asdict(player) for player in self.players.values()],
+            "units": [{**asdict(unit), "turn_built": observed[unit.units_id]} for unit in all_units.values()],
+            "inferred_turn_built": {unit.units_id: unit.turn_built for unit in all_units.values()},
+            "turn_players": self.turn_players,
+            "turn_days": self.turn_days,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def load_state(self, path: str) -> Tuple[Dict[int, Unit], Optional[int]]:
+        if not os.path.exists(path):
+            return {}, None
+
+        with open(path) as f:
+            state = json.load(f)
+
+        self.players = {data["players_id"]: Player(**data) for data in state["players"]}
+        self.seats = [player.players_id for player in sorted(self.players.values(), key=lambda player: player.players_order)]
+        self.me = self.players[state["me"]]
+        # JSON keys are always strings
+        self.turn_players = {int(turn): players_id for turn, players_id in state.get("turn_players", {}).items()}
+        self.turn_days = {int(turn): day for turn, day in state.get("turn_days", {}).items()}
+
+        all_units: Dict[int, Unit] = {}
+        for data in state["units"]:
+            unit = Unit(**data, players=self.players, unit_costs=self.unit_costs)
+            all_units[unit.units_id] = unit
+
+        return all_units, state["max_turn"]
+
+
+def read_game_ids(path: str) -> List[str]:
+    """
+    Game IDs from a file ("-" for stdin), separated by whitespace, commas or
+    new lines. Game links work too. Anything after a # is ignored.
+    """
+    with (contextlib.nullcontext(sys.stdin) if path == "-" else open(path)) as f:
+        text = f.read()
+
+    game_ids = []
+    for line in text.splitlines():
+        for token in re.split(r"[\s,]+", line.split("#", 1)[0]):
+            if not token:
+                continue
+            match = re.search(r"games_id=(\d+)", token) or re.fullmatch(r"(\d+)", token)
+            if match is None:
+                raise ValueError(f"Not a game ID: {token}")
+            game_ids.append(match.group(1))
+    return game_ids
+
+
+class BuildOrderSummary():
+    """
+    When each unit type first appeared in a batch of games, for me and for my
+    opponents. Only counts units that were built during the game.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.first_days: Dict[Tuple[bool, str], List[int]] = {}  # (enemy, unit name): [day, ...]
+
+    def add_game(self, records: List[Dict[str, Any]]) -> None:
+        first_day: Dict[Tuple[bool, str], int] = {}
+        for record in records:
+            if record["turn_built"] is None or record["turn_built"] < 0:
+                continue
+            key = (record["enemy"], record["units_name"])
+            first_day[key] = min(record["day_built"], first_day.get(key, record["day_built"]))
+
+        self.games += 1
+        for key, day in first_day.items():
+            self.first_days.setdefault(key, []).append(day)
+
+    def report(self, enemy: bool) -> List[Tuple[str, int, float, int]]:
+        """
+        (unit name, games it was built in, average first day, earliest day),
+        earliest on average first.
+        """
+        rows = [
+            (unit_name, len(days), sum(days) / len(days), min(days))
+            for (unit_enemy, unit_name), days in self.first_days.items()
+            if unit_enemy == enemy
+        ]
+        return sorted(rows, key=lambda row: (row[2], row[0]))
+
+    def print_report(self) -> None:
+        for enemy, whose in ((True, "OPPONENTS"), (False, "MINE")):
+            print(f"\n==FIRST APPEARANCE ACROSS {self.games} GAMES ({whose})==")
+            rows = self.report(enemy)
+            if not rows:
+                print("No units built")
+                continue
+            print(f"{'Unit':<12} {'Games':>5} {'Avg day':>8} {'Earliest':>8}")
+            for unit_name, games, average, earliest in rows:
+                print(f"{unit_name:<12} {games:>5} {average:>8.1f} {earliest:>8}")
+
+
+def analyse_batch_game(
+    game_id: Optional[str],
+    only_enemy: bool,
+    workers: int,
+    summary: bool=False,
+    archive_path: Optional[str]=None,
+) -> List[Dict[str, Any]]:
+    """
+    One game of a batch, in a batch process (see `batch.run_batch`). Returns
+    every unit's record.
+    """
+    worker = batch.worker
+    writer = ListWriter(BUILD_ORDER_FIELDS)
+    archive = ReplayArchive(archive_path) if archive_path else None
+    try:
+        analyser = Analyser(game_id, False, worker.cache, workers, worker.transport, archive, worker.cookie)
+        analyser.show_progress = False
+        print(f"\n##### GAME {analyser.game_id} #####")
+        analyser.find_unit_production_days(only_enemy, writer, summary)
+    finally:
+        if archive is not None:
+            archive.close()
+    return writer.rows
+
+
+def analyse_games(
+    game_ids: List[str],
+    archive_paths: List[str],
+    only_enemy: bool,
+    processes: int,
+    workers: int,
+    rate: Optional[float],
+    cache: Optional[TurnCache]=None,
+    summary: bool=False,
+    writer: Optional[RecordWriter]=None,
+) -> BuildOrderSummary:
+    """
+    Build orders for many games (and archives) at once, printed as each game
+    finishes, then when each unit type first appeared across all of them.
+    """
+    games = BuildOrderSummary()
+
+    # Only log in once
+    cookie = get_cookie(Transport(rate=rate)) if game_ids else load_creds(require_password=False)
+    jobs = [(game_id, analyse_batch_game, (game_id, only_enemy, workers, summary)) for game_id in game_ids]
+    jobs += [(path, analyse_batch_game, (None, only_enemy, workers, summary, path)) for path in archive_paths]
+    for _, records in batch.run_batch(jobs, processes, cookie, cache, rate, workers):
+        if records:
+            games.add_game(records)
+            if writer is not None:
+                for record in records:
+                    writer.write(record)
+
+    games.print_report()
+    return games
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Find unit production days for a specific game.")
+    parser = argparse.ArgumentParser(description="Find unit production days for one or more games.")
+    parser.add_argument(
+        "game_ids",
+        type=str,
+        nargs="*",
+        metavar="game_id",
+        help="The ID of the game. Give several to analyse them all at once, and summarise them."
+    )
     parser.add_argument(
-        "game_id",
+        "--ids-file",
+        metavar="FILE",
+        help="Also analyse the game IDs (or game links) listed in FILE. Use - to read them from stdin."
+    )
+    parser.add_argument(
+        "--from-archive",
         type=str,
-        help="The ID of the game."
+        nargs="+",
+        metavar="PATH",
+        help="Analyse replay archives (see replay_archive.py), or directories of them, instead of downloading the games."
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=4,
+        help="With several games, how many to analyse at once (default 4)."
     )
     parser.add_argument(
         "--only-enemy",
@@ -288,10 +757,163 @@ def main():
         action="store_true",
         help="Show additional debugging information."
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always download turns, instead of using the on-disk turn cache."
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="Where to keep the turn cache."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Maximum size of the turn cache, in MB. Least recently used turns are dropped first."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"How many turns to download at once (default {DEFAULT_WORKERS}). Use 1 to download one turn at a time."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Maximum requests per second sent to AWBW (default {DEFAULT_RATE}). Use 0 for no limit."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Remember what has been seen in this game, and only download new turns on the next run."
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=0,
+        help="With --watch, keep checking for new turns every INTERVAL seconds."
+    )
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="Also show each player's unit ratios, captures and damage dealt, worked out in the same pass."
+    )
+    parser.add_argument(
+        "--ledger",
+        action="store_true",
+        help="Also show where each player's funds went: income, builds, repairs, and spend on units we haven't seen."
+    )
+    parser.add_argument(
+        "--export",
+        metavar="FILE",
+        help="Also write every unit's build turn to FILE, as .jsonl, .csv or .parquet (needs pyarrow)."
+    )
+    parser.add_argument(
+        "--history",
+        nargs="+",
+        type=int,
+        metavar="UNIT_ID",
+        help="Also show every sighting of these units (IDs are shown with --debug)."
+    )
+    parser.add_argument(
+        "--timeline",
+        metavar="FILE",
+        help="Also write every sighting of every unit (not just the last) to FILE, as .jsonl, .csv or .parquet."
+    )
+    parser.add_argument(
+        "--profile",
+        "--stats",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Record time spent in each phase, per turn, and request latency. Prints a JSON summary at the end, or writes it to FILE."
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="FILE",
+        help="Run under cProfile, and save the stats to FILE."
+    )
     args = parser.parse_args()
 
-    analyser = Analyser(args.game_id, args.debug)
-    analyser.find_unit_production_days(only_enemy=args.only_enemy)
+    game_ids = list(args.game_ids)
+    if args.ids_file:
+        try:
+            game_ids += read_game_ids(args.ids_file)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    # The same game listed twice would only be counted twice in the summary
+    game_ids = list(dict.fromkeys(game_ids))
+    archive_paths = find_archives(args.from_archive) if args.from_archive else []
+
+    if not game_ids and not archive_paths:
+        parser.error("Either a game_id, --ids-file or --from-archive is required")
+    many_games = len(game_ids) + len(archive_paths) > 1
+    if many_games and args.watch:
+        parser.error("--watch only works with one game")
+    if args.export and args.watch:
+        parser.error("--export can't be used with --watch")
+    if args.summary and args.watch:
+        parser.error("--summary can't be used with --watch")
+    if (args.history or args.timeline) and (many_games or args.watch):
+        parser.error("--history and --timeline only work with one game, without --watch")
+    if args.ledger and many_games:
+        parser.error("--ledger only works with one game")
+
+    if args.profile:
+        profiling.enable()
+
+    cache = None
+    if not args.no_cache:
+        cache = TurnCache(args.cache_path, args.cache_size * 1024 * 1024)
+
+    if many_games:
+        with profiling.cprofile(args.cprofile):
+            with open_writer(args.export, BUILD_ORDER_FIELDS) if args.export else contextlib.nullcontext() as writer:
+                analyse_games(
+                    game_ids, archive_paths, args.only_enemy, args.processes, args.workers, args.rate,
+                    cache, args.summary, writer,
+                )
+        if args.profile:
+            profiling.write_summary(args.profile)
+        return
+
+    transport = Transport(rate=args.rate, burst=max(1, args.workers))
+    archive = ReplayArchive(archive_paths[0]) if archive_paths else None
+    with profiling.cprofile(args.cprofile):
+        timeline = UnitTimeline() if args.history or args.timeline else None
+        analyser = Analyser(game_ids[0] if game_ids else None, args.debug, cache, args.workers, transport, archive, timeline=timeline)
+        if args.watch:
+            analyser.watch(only_enemy=args.only_enemy, interval=args.interval, ledger=args.ledger)
+        elif args.export:
+            with open_writer(args.export, BUILD_ORDER_FIELDS) as writer:
+                analyser.find_unit_production_days(only_enemy=args.only_enemy, writer=writer, summary=args.summary, ledger=args.ledger)
+        else:
+            analyser.find_unit_production_days(only_enemy=args.only_enemy, summary=args.summary, ledger=args.ledger)
+
+        if timeline is not None:
+            for unit_id in args.history or ():
+                analyser.print_history(unit_id)
+            if args.timeline:
+                with profiling.phase("export"), open_writer(args.timeline, TIMELINE_FIELDS) as writer:
+                    for record in timeline.records(int(analyser.game_id)):
+                        writer.write(record)
+
+    if args.debug:
+        if cache is not None:
+            print(f"\nTurn cache: {cache.stats}")
+        latency = transport.latency_summary()
+        if latency["count"]:
+            print(
+                f"Requests: {latency['count']}, latency mean {latency['mean']:.3f}s, "
+                f"p50 {latency['p50']:.3f}s, p90 {latency['p90']:.3f}s, max {latency['max']:.3f}s"
+            )
+
+    if args.profile:
+        profiling.write_summary(args.profile, {"cache": asdict(cache.stats) if cache is not None else None})
 
 
 if __name__ == "__main__":
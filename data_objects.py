@@ -1,8 +1,59 @@
 from dataclasses import dataclass, fields
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional, Union
 
 
-@dataclass
+# Used when a unit is missing its cost. Replaced by the costs in the game state
+# (`generic_units`) where possible - see `load_unit_costs`.
+UNIT_COSTS: Dict[str, int] = {
+    "black boat": 7500,
+    "piperunner": 20000,
+    "black bomb": 25000,
+    "infantry": 1000,
+    "mech": 3000,
+    "md.tank": 16000,
+    "tank": 7000,
+    "recon": 4000,
+    "apc": 5000,
+    "artillery": 6000,
+    "rocket": 15000,
+    "anti-air": 8000,
+    "missile": 12000,
+    "fighter": 20000,
+    "bomber": 22000,
+    "b-copter": 9000,
+    "t-copter": 5000,
+    "battleship": 28000,
+    "cruiser": 18000,
+    "lander": 12000,
+    "sub": 20000,
+    "neotank": 22000,
+    "mega tank": 28000,
+    "carrier": 30000,
+    "stealth": 24000,
+}
+
+
+def load_unit_costs(generic_units: Union[Dict[Any, Dict], Iterable[Dict], None]) -> Dict[str, int]:
+    """
+    Build a unit cost table from the gameState's `generic_units`, falling back
+    to the hardcoded costs for anything it doesn't mention.
+    """
+    costs = dict(UNIT_COSTS)
+    if not generic_units:
+        return costs
+
+    if isinstance(generic_units, dict):
+        generic_units = generic_units.values()
+    for generic_unit in generic_units:
+        name = generic_unit.get("units_name")
+        cost = generic_unit.get("units_cost")
+        if name and cost:
+            costs[name.lower()] = int(cost)
+
+    return costs
+
+
+@dataclass(slots=True)
 class Player:
     users_username: str
     users_id: int
@@ -40,7 +91,7 @@ class Player:
         return f"<Player {self.users_username} ({self.players_id})>"
 
 
-@dataclass
+@dataclass(slots=True)
 class Unit:
     units_id: int
     units_games_id: int
@@ -78,61 +129,30 @@ class Unit:
     extra_distance: Optional[int] = None
     last_seen_turn: Optional[int] = None
 
-    def __init__(self, players: Dict[int, Player], **kwargs: Any) -> None:
-        # Get the field names from the dataclass
-        valid_fields = {f.name for f in fields(self.__class__)}
-        # Set all valid fields to None initially
-        for field in valid_fields:
-            setattr(self, field, None)
-
-        # Update with provided kwargs, filtering only valid fields
-        for key, value in kwargs.items():
-            if key in valid_fields:
-                setattr(self, key, value)
+    def __init__(self, players: Dict[int, Player], unit_costs: Optional[Dict[str, int]] = None, **kwargs: Any) -> None:
+        # Every field is set exactly once - missing ones become None, and
+        # anything that isn't a field is ignored
+        get = kwargs.get
+        for field in UNIT_FIELDS:
+            setattr(self, field, get(field))
 
         # Set player name based on ID - FIXME this is such a dumb hack
         self.player_name = players[self.units_players_id].users_username
 
-        self.__fix_unit_cost__()
+        self.__fix_unit_cost__(unit_costs or UNIT_COSTS)
 
-    def __fix_unit_cost__(self) -> None:
+    def __fix_unit_cost__(self, unit_costs: Dict[str, int]) -> None:
         """
         If a unit passes across the screen, but does not finish movement in
         vision, many of these will be empty, causing issues. Most concerning is
-        `units_cost`, which I have jankily hardcoded to be slightly fixed for
-        common use cases.
+        `units_cost`, which we look up by name instead.
         """
-        lookup = {
-            "black boat": 7500,
-            "piperunner": 20000,
-            "black bomb": 25000,
-            "infantry": 1000,
-            "mech": 3000,
-            "md.tank": 16000,
-            "tank": 7000,
-            "recon": 4000,
-            "apc": 5000,
-            "artillery": 6000,
-            "rocket": 15000,
-            "anti-air": 8000,
-            "missile": 12000,
-            "fighter": 20000,
-            "bomber": 22000,
-            "b-copter": 9000,
-            "t-copter": 5000,
-            "battleship": 28000,
-            "cruiser": 18000,
-            "lander": 12000,
-            "sub": 20000,
-            "neotank": 22000,
-            "mega tank": 28000,
-            "carrier": 30000,
-            "stealth": 24000,
-            # FIXME use that actual lookup that old mate has in the gamestate json (generic_units)
-        }
-
         if not self.units_cost and self.units_name:
-            self.units_cost = lookup.get(self.units_name.lower(), 0)
+            self.units_cost = unit_costs.get(self.units_name.lower(), 0)
 
     def __repr__(self) -> str:
         return f"<Unit {self.units_name} ({self.units_id}) {self.player_name} turn {self.turn_built}>"
+
+
+# Worked out once, instead of for every unit
+UNIT_FIELDS = tuple(field.name for field in fields(Unit))
@@ -0,0 +1,197 @@
+"""
+Machine readable output for both tools. Records are written as soon as they
+are produced, so exporting thousands of games doesn't need them all in memory.
+
+    with open_writer("builds.csv", BUILD_ORDER_FIELDS) as writer:
+        writer.write({"game_id": 123, ...})
+
+The format comes from the file extension: `.jsonl`, `.csv` or `.parquet`
+(which needs pyarrow).
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
+
+import csv
+import json
+
+
+# Field: type. Every record of one kind has the same fields, so CSV and Parquet
+# files get a fixed set of columns.
+BUILD_ORDER_FIELDS: Dict[str, type] = {
+    "game_id": int,
+    "units_id": int,
+    "player_name": str,
+    "units_players_id": int,
+    "enemy": bool,
+    "units_name": str,
+    "units_cost": int,
+    "turn_built": int,
+    "day_built": int,
+    "last_seen_turn": int,
+    "units_x": int,
+    "units_y": int,
+    "units_hit_points": int,
+}
+
+TURN_FIELDS: Dict[str, type] = {
+    "game_id": int,
+    "player": str,
+    "co": str,
+    "turn": int,
+    "day": int,
+    "leftover_funds": int,
+    "income": int,
+    "captures": int,
+    "units_built": dict,  # Unit name: number built
+}
+
+
+def flatten(value: Any) -> Any:
+    """
+    CSV and Parquet columns can't hold dicts or lists, so they get JSON.
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), sort_keys=True)
+    return value
+
+
+class RecordWriter(ABC):
+
+    def __init__(self, path: str, fields: Dict[str, type]):
+        self.path = path
+        self.fields = fields
+        self.records = 0
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @abstractmethod
+    def write(self, record: Dict[str, Any]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class ListWriter(RecordWriter):
+    """
+    Keeps the records in memory (`rows`), e.g: to send them somewhere else.
+    """
+
+    def __init__(self, fields: Dict[str, type]):
+        super().__init__("", fields)
+        self.rows: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.rows.append(record)
+        self.records += 1
+
+
+class JsonLinesWriter(RecordWriter):
+
+    def __init__(self, path: str, fields: Dict[str, type]):
+        super().__init__(path, fields)
+        self._file = open(path, "w")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps({field: record.get(field) for field in self.fields}) + "\n")
+        self.records += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CsvWriter(RecordWriter):
+
+    def __init__(self, path: str, fields: Dict[str, type]):
+        super().__init__(path, fields)
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=list(fields), extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._writer.writerow({field: flatten(record.get(field)) for field in self.fields})
+        self.records += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def parquet_schema(pyarrow: Any, fields: Dict[str, type]) -> Any:
+    """
+    The Parquet columns for `fields`. Dicts are written as JSON strings.
+    """
+    arrow_types = {
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        str: pyarrow.string(),
+        bool: pyarrow.bool_(),
+        dict: pyarrow.string(),
+    }
+    unknown = [field for field, kind in fields.items() if kind not in arrow_types]
+    if unknown:
+        raise ValueError(f"Don't know how to write {', '.join(unknown)} to Parquet")
+    return pyarrow.schema([(field, arrow_types[kind]) for field, kind in fields.items()])
+
+
+class ParquetWriter(RecordWriter):
+    """
+    Buffers `batch_size` records at a time, and writes each batch as its own
+    row group.
+    """
+
+    def __init__(self, path: str, fields: Dict[str, type], batch_size: int = 10000):
+        super().__init__(path, fields)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Writing Parquet needs pyarrow (pip install pyarrow). Use .jsonl or .csv instead.")
+
+        self._pyarrow = pyarrow
+        self._schema = parquet_schema(pyarrow, fields)
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        self._batch_size = batch_size
+        self._columns: Dict[str, List[Any]] = {field: [] for field in fields}
+        self._buffered = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        for field, column in self._columns.items():
+            column.append(flatten(record.get(field)))
+        self.records += 1
+        self._buffered += 1
+        if self._buffered >= self._batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffered:
+            return
+        self._writer.write_table(self._pyarrow.table(self._columns, schema=self._schema))
+        for column in self._columns.values():
+            column.clear()
+        self._buffered = 0
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def open_writer(path: str, fields: Dict[str, type]) -> RecordWriter:
+    """
+    Open a writer for `path`, in the format its extension says.
+    """
+    format = path.rsplit(".", 1)[-1].lower()
+    if format not in WRITERS:
+        raise ValueError(f"Don't know how to export {path} - use a .jsonl, .csv or .parquet file")
+    return WRITERS[format](path, fields)
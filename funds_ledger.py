@@ -0,0 +1,273 @@
+"""
+Where each player's funds went: income, what we saw them build, what they
+must have spent repairing, and what's left over - spend we can't account for,
+which in fog is mostly units we haven't seen.
+
+The ledger is an `Analysis`, so it's filled in the same pass over the game as
+everything else. Each player's turns are kept as columns (one `array` each),
+and `report` works the running totals out over all of them at once - with
+NumPy if it is installed, or plain Python if not. Either way it's cheap enough
+to redo after every turn of a live game.
+"""
+
+from array import array
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+from action_pipeline import ActionPipeline, Analysis, current_day, current_player
+from data_objects import load_unit_costs
+
+
+# Income from each property, unless the game says otherwise
+FUNDS_PER_PROPERTY = 1000
+
+COLUMNS = ("turn", "day", "known", "funds", "income", "build", "repair")
+
+
+class PlayerLedger():
+    """
+    One row per turn of one player. `funds` is what they had when the turn
+    started (after income and repairs), `build` what we saw them spend during
+    it. `known` is 0 where we weren't shown their funds (e.g: the enemy's, in
+    fog).
+    """
+
+    def __init__(self):
+        self.turn = array("i")
+        self.day = array("i")
+        self.known = array("b")
+        self.funds = array("q")
+        self.income = array("q")
+        self.build = array("q")
+        self.repair = array("q")
+
+    def __len__(self) -> int:
+        return len(self.turn)
+
+    def columns(self) -> Dict[str, array]:
+        return {name: getattr(self, name) for name in COLUMNS}
+
+    def truncate(self, turn: int) -> None:
+        """
+        Forget `turn` and everything after it.
+        """
+        rows = len(self.turn)
+        while rows and self.turn[rows - 1] >= turn:
+            rows -= 1
+        for column in self.columns().values():
+            del column[rows:]
+
+
+class FundsLedger(Analysis):
+
+    def __init__(self, unit_costs: Optional[Dict[str, int]] = None, funds_per_property: int = FUNDS_PER_PROPERTY):
+        self.unit_costs = unit_costs
+        self.funds_per_property = funds_per_property
+        self.players: Dict[int, PlayerLedger] = {}  # players_id: ledger
+        self.names: Dict[int, str] = {}  # players_id: username
+        self._hp: Dict[int, float] = {}  # units_id: last HP seen
+        # What `_hp` was before the newest turn, in case it is seen again
+        self._newest_turn: Optional[int] = None
+        self._hp_before_newest: Dict[int, float] = {}
+        self._player: Optional[int] = None
+        # Income properties each player captured since their last turn
+        self._captures: Dict[int, int] = {}  # players_id: captures
+        self._captures_before_newest: Dict[int, int] = {}
+
+    def register(self, pipeline: ActionPipeline) -> None:
+        pipeline.on("Build", self.on_build)
+        pipeline.on("Move", self.on_move)
+        pipeline.on("Fire", self.on_fire)
+        pipeline.on("Join", self.on_join)
+        pipeline.on("Capt", self.on_capture)
+
+    def cost(self, unit: Dict) -> int:
+        return unit.get("units_cost") or self.unit_costs.get(str(unit.get("units_name")).lower(), 0)
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        game_state = turn_json["gameState"]
+        if self.unit_costs is None:
+            self.unit_costs = load_unit_costs(game_state.get("generic_units"))
+        self._player = player_id = current_player(turn_json)
+        # Seeing the newest turn again (in a live game) replaces it
+        if turn == self._newest_turn:
+            self._hp = dict(self._hp_before_newest)
+            self._captures = dict(self._captures_before_newest)
+            for ledger in self.players.values():
+                ledger.truncate(turn)
+        else:
+            self._hp_before_newest = dict(self._hp)
+            self._captures_before_newest = dict(self._captures)
+        self._newest_turn = turn
+
+        # Units repaired on properties at the start of the turn come back with
+        # more HP than they had when we last saw them
+        repair = 0
+        for data in game_state["units"].values():
+            unit_id = int(data["units_id"])
+            hit_points = data.get("units_hit_points")
+            if hit_points is None:
+                continue
+            last_seen = self._hp.get(unit_id)
+            if int(data["units_players_id"]) == player_id and last_seen is not None and hit_points > last_seen:
+                repair += round((hit_points - last_seen) * self.cost(data) / 10)
+            self._hp[unit_id] = hit_points
+
+        player = game_state["players"].get(str(player_id), {})
+        self.names[player_id] = player.get("users_username")
+        funds = player.get("players_funds")
+        income = player.get("players_income")
+
+        ledger = self.players.setdefault(player_id, PlayerLedger())
+        captures = self._captures.pop(player_id, 0)
+        if not isinstance(income, int):
+            income = self.estimate_income(ledger, captures)
+        ledger.turn.append(turn)
+        ledger.day.append(current_day(turn, turn_json))
+        ledger.known.append(isinstance(funds, int))
+        ledger.funds.append(funds if isinstance(funds, int) else 0)
+        ledger.income.append(income)
+        ledger.build.append(0)
+        ledger.repair.append(repair)
+
+    def estimate_income(self, ledger: PlayerLedger, captures: int) -> int:
+        """
+        Income we weren't shown is taken to be last turn's, plus the properties
+        we saw them capture since.
+        """
+        return (ledger.income[-1] if ledger.income else 0) + captures * self.funds_per_property
+
+    def on_build(self, turn: int, action: Dict) -> None:
+        unit = action["newUnit"]
+        self._hp[int(unit["units_id"])] = unit.get("units_hit_points")
+        ledger = self.players.get(self._player)
+        if ledger is not None and ledger.build:
+            ledger.build[-1] += self.cost(unit)
+
+    def on_move(self, turn: int, action: Dict) -> None:
+        unit = action["unit"]
+        if unit.get("units_hit_points") is not None:
+            self._hp[int(unit["units_id"])] = unit["units_hit_points"]
+
+    def on_fire(self, turn: int, action: Dict) -> None:
+        for unit in (action.get("attacker"), action.get("defender")):
+            if isinstance(unit, dict) and unit.get("units_hit_points") is not None:
+                self._hp[int(unit["units_id"])] = unit["units_hit_points"]
+
+    def on_join(self, turn: int, action: Dict) -> None:
+        unit = action["joinedUnit"]
+        self._hp[int(unit["units_id"])] = unit.get("units_hit_points")
+
+    def on_capture(self, turn: int, action: Dict) -> None:
+        # Same as `Captures`: com towers and labs don't give income
+        building = action["buildingInfo"]
+        terrain_name = building["terrain_name"].lower()
+        if building["buildings_capture"] != 20 or "com tower" in terrain_name or terrain_name.endswith("lab"):
+            return
+        self._captures[self._player] = self._captures.get(self._player, 0) + 1
+
+    def report(self, players_id: int) -> Dict[str, Any]:
+        """
+        Running totals for each of the player's turns, as lists:
+
+            earned       Funds earned so far, including starting funds
+            spent        Funds gone by the start of the turn (only where
+                         their funds are known, else None)
+            unexplained  Spent, but not on anything we saw - hidden units
+            available    Most they could spend this turn
+            hidden_army_value   Unexplained spend as of their latest turn.
+                                If their funds were hidden then, it's
+                                estimated as everything available (the
+                                most it could be)
+            hidden_army_estimated   Whether it was estimated
+            earliest_day        {unit name: first day they could afford it}
+        """
+        ledger = self.players[players_id]
+        if not len(ledger):
+            return {}
+        costs = {name: cost for name, cost in self.unit_costs.items() if cost}
+        try:
+            import numpy
+        except ImportError:
+            totals = _running_totals(ledger, costs)
+        else:
+            totals = _running_totals_numpy(numpy, ledger, costs)
+
+        unexplained = totals["unexplained"][-1]
+        estimated = unexplained is None
+        return {
+            "players_id": players_id,
+            "username": self.names.get(players_id),
+            "turn": list(ledger.turn),
+            **totals,
+            "build_spend": sum(ledger.build),
+            "repair_spend": sum(ledger.repair),
+            "income": ledger.income[-1],
+            "hidden_army_value": max(0, totals["available"][-1] if estimated else unexplained),
+            "hidden_army_estimated": estimated,
+        }
+
+
+def _starting_funds(ledger: PlayerLedger) -> int:
+    # Turn zero's funds are starting funds plus the first day's income
+    return max(0, ledger.funds[0] - ledger.income[0]) if ledger.known[0] else 0
+
+
+def _earliest_day(days: List[int], available: List[int], costs: Dict[str, int]) -> Dict[str, Optional[int]]:
+    return {name: next((day for day, funds in zip(days, available) if funds >= cost), None) for name, cost in costs.items()}
+
+
+def _running_totals(ledger: PlayerLedger, costs: Dict[str, int]) -> Dict[str, Any]:
+    start = _starting_funds(ledger)
+    earned = [start + income for income in accumulate(ledger.income)]
+    # Repairs come out at the start of a turn, builds during it
+    seen = [repair + build - this_build for repair, build, this_build in zip(accumulate(ledger.repair), accumulate(ledger.build), ledger.build)]
+
+    spent, unexplained, available = [], [], []
+    for known, funds, total, seen_spend in zip(ledger.known, ledger.funds, earned, seen):
+        if not known:
+            spent.append(None)
+            unexplained.append(None)
+            available.append(total - seen_spend)
+        else:
+            spent.append(total - funds)
+            unexplained.append(total - funds - seen_spend)
+            available.append(funds)
+
+    return {
+        "earned": earned,
+        "spent": spent,
+        "unexplained": unexplained,
+        "available": available,
+        "earliest_day": _earliest_day(list(ledger.day), available, costs),
+    }
+
+
+def _running_totals_numpy(numpy: Any, ledger: PlayerLedger, costs: Dict[str, int]) -> Dict[str, Any]:
+    column = {name: numpy.frombuffer(values, dtype=values.typecode) for name, values in ledger.columns().items()}
+    known = column["known"].astype(bool)
+
+    earned = _starting_funds(ledger) + numpy.cumsum(column["income"])
+    seen = numpy.cumsum(column["repair"]) + numpy.cumsum(column["build"]) - column["build"]
+    spent = earned - column["funds"]
+    unexplained = spent - seen
+    available = numpy.where(known, column["funds"], earned - seen)
+
+    # First turn each unit type was affordable, for every type at once
+    names = list(costs)
+    affordable = available[:, None] >= numpy.array([costs[name] for name in names])[None, :]
+    first_row = affordable.argmax(axis=0)
+    days = column["day"][first_row]
+    earliest_day = {name: int(day) if ever else None for name, day, ever in zip(names, days, affordable.any(axis=0))}
+
+    return {
+        "earned": earned.tolist(),
+        "spent": _where_known(spent.tolist(), known.tolist()),
+        "unexplained": _where_known(unexplained.tolist(), known.tolist()),
+        "available": available.tolist(),
+        "earliest_day": earliest_day,
+    }
+
+
+def _where_known(values: List[int], known: List[bool]) -> List[Optional[int]]:
+    return [value if is_known else None for value, is_known in zip(values, known)]
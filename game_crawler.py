@@ -0,0 +1,249 @@
+"""
+Game IDs from AWBW's completed games search (gamescompleted.php), newest first.
+
+Results only ever grow at the top, so once a search has been crawled, the
+next crawl can stop at the first game it has seen before - everything after
+that is already known. Each search's results are kept in the game store, so a
+daily refresh of a player or a map usually costs a single page request. A
+crawl that was cut short (`max_pages`) carries on from where it stopped the
+next time it gets past the new games.
+
+Pages are read as they stream in, and reading stops at the first known game
+without downloading the rest of the page. Once the page size is known, up to
+`workers` pages are requested at once.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Container, Dict, Iterable, Iterator, List, Optional
+
+import re
+
+import profiling
+from awbw_api import BASE_URL
+from game_store import GameStore
+from transport import Transport, default_transport
+
+
+DEFAULT_PAGE_WORKERS = 4
+CHUNK_SIZE = 16 * 1024
+
+# Links are HTML escaped, but a game ID never is
+GAME_LINK = re.compile(rb"game\.php\?games_id=(\d+)&(?:amp;)?ndx=0")
+# Longer than any link, so one split between chunks is still found
+LINK_OVERLAP = 64
+
+# When carrying on a crawl after the known games, start a few places early in
+# case games vanished from the results. Duplicates are skipped.
+RESUME_OVERLAP = 10
+
+
+@dataclass
+class ResultsPage:
+    game_ids: List[str]
+    # Whether reading stopped at a known game
+    stopped: bool
+
+
+def parse_game_ids(chunks: Iterable[bytes], stop: Container[str] = ()) -> ResultsPage:
+    """
+    Game IDs linked from a results page, in order and without duplicates, read
+    a chunk at a time. Stops at the first game in `stop`.
+    """
+    game_ids: List[str] = []
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        end = 0
+        for match in GAME_LINK.finditer(buffer):
+            game_id = match.group(1).decode()
+            if game_id in stop:
+                return ResultsPage(game_ids, True)
+            if game_id not in game_ids:
+                game_ids.append(game_id)
+            end = match.end()
+        buffer = buffer[max(end, len(buffer) - LINK_OVERLAP):]
+    return ResultsPage(game_ids, False)
+
+
+def fetch_page(query: str, start: int, cookie: Dict, transport: Transport, stop: Container[str] = ()) -> ResultsPage:
+    """
+    One page of results. `start` is the position of its first game.
+    """
+    with profiling.phase("crawl_page"):
+        response = transport.get(f"{BASE_URL}/gamescompleted.php?start={start}&{query}", cookies=cookie, stream=True)
+        try:
+            return parse_game_ids(response.iter_content(CHUNK_SIZE), stop)
+        finally:
+            response.close()
+
+
+class PageWalk():
+    """
+    Game IDs from consecutive pages of results, starting at position `start`,
+    skipping any in `seen` (and adding the rest to it). Afterwards, `reason`
+    says why it stopped: "known" (reached a game in `stop`), "end" (past the
+    last page) or "limit" (read `max_pages` pages).
+    """
+
+    def __init__(
+        self,
+        crawler: "GameCrawler",
+        query: str,
+        start: int,
+        stop: Container[str],
+        seen: set,
+        max_pages: Optional[int] = None,
+        page_size: Optional[int] = None,
+    ):
+        self.crawler = crawler
+        self.query = query
+        self.start = start
+        self.stop = stop
+        self.seen = seen
+        self.max_pages = max_pages
+        self.pages = 0
+        # Given by an earlier crawl, or learned from the first page if it was
+        # full
+        self.page_size = page_size
+        self.reason: Optional[str] = None
+
+    def fetch(self, start: int) -> ResultsPage:
+        return fetch_page(self.query, start, self.crawler.cookie, self.crawler.transport, self.stop)
+
+    def __iter__(self) -> Iterator[str]:
+        if self.max_pages is not None and self.max_pages <= 0:
+            self.reason = "limit"
+            return
+
+        # The first page on its own: it's often the only one needed
+        page = self.fetch(self.start)
+        first_pages = [page]
+        if self.page_size is None and page.game_ids and not page.stopped and self.max_pages != 1:
+            # Only a full page gives the page size, and the first page might
+            # be the last - it was full if there are more games after it
+            after = self.fetch(self.start + len(page.game_ids))
+            first_pages.append(after)
+            if any(game_id not in page.game_ids for game_id in after.game_ids):
+                self.page_size = len(page.game_ids)
+
+        pages: Iterator[ResultsPage] = iter(first_pages)
+        last = first_pages[-1]
+        if self.page_size and len(last.game_ids) == self.page_size and not last.stopped:
+            pages = self.pages_from(first_pages, self.page_size)
+
+        for page in pages:
+            self.pages += 1
+            new_ids = [game_id for game_id in page.game_ids if game_id not in self.seen]
+            if not new_ids and not page.stopped:
+                # Past the last page (AWBW repeats it)
+                self.reason = "end"
+                return
+            for game_id in new_ids:
+                self.seen.add(game_id)
+                yield game_id
+            if page.stopped:
+                self.reason = "known"
+                return
+            if self.max_pages is not None and self.pages >= self.max_pages:
+                self.reason = "limit"
+                return
+        self.reason = "end"
+
+    def pages_from(self, first_pages: List[ResultsPage], page_size: int) -> Iterator[ResultsPage]:
+        """
+        `first_pages` (full pages, already fetched), then the pages after them
+        in order, with up to `workers` requests in flight.
+        """
+        yield from first_pages
+
+        workers = self.crawler.workers
+        next_start = self.start + len(first_pages) * page_size
+        requested = len(first_pages)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def submit() -> None:
+                nonlocal next_start, requested
+                if self.max_pages is None or requested < self.max_pages:
+                    pending.append(executor.submit(self.fetch, next_start))
+                    next_start += page_size
+                    requested += 1
+
+            try:
+                for _ in range(workers):
+                    submit()
+                while pending:
+                    page = pending.popleft().result()
+                    if len(page.game_ids) < page_size:
+                        # The last page - nothing after it is worth waiting for
+                        for future in pending:
+                            future.cancel()
+                        pending.clear()
+                    else:
+                        # Keep the pool busy while the caller works on this page
+                        submit()
+                    yield page
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class GameCrawler():
+
+    def __init__(
+        self,
+        cookie: Dict,
+        store: Optional[GameStore] = None,
+        transport: Optional[Transport] = None,
+        workers: int = DEFAULT_PAGE_WORKERS,
+    ):
+        self.cookie = cookie
+        self.store = store
+        self.transport = transport or default_transport()
+        self.workers = max(1, workers)
+
+    def iter_games(self, query: str, max_pages: Optional[int] = None) -> Iterator[str]:
+        """
+        Every game ID for a search (e.g: "username=someone&type=fog"), newest
+        first. Gives at most `max_pages` pages' worth (None for every page),
+        reading only the pages that an earlier crawl of the same search didn't.
+        """
+        known, known_complete, page_size = self.store.crawl(query) if self.store is not None else ([], False, None)
+        seen: set = set()
+        crawled: List[str] = []
+        complete = False
+
+        walk = PageWalk(self, query, 1, set(known), seen, max_pages, page_size)
+        try:
+            for game_id in walk:
+                crawled.append(game_id)
+                yield game_id
+
+            page_size = walk.page_size or page_size
+            if walk.reason != "known":
+                complete = walk.reason == "end"
+                return
+
+            # Everything from here on was found last time
+            rest = [game_id for game_id in known if game_id not in seen]
+            seen.update(rest)
+            limit = None if max_pages is None or not page_size else max_pages * page_size
+            given = len(crawled)
+            crawled += rest
+            complete = known_complete
+            yield from rest[:None if limit is None else max(0, limit - given)]
+
+            if not complete and (max_pages is None or (walk.pages < max_pages and (limit is None or len(crawled) < limit))):
+                start = max(1, len(crawled) + 1 - RESUME_OVERLAP)
+                pages_left = None if max_pages is None else max_pages - walk.pages
+                older = PageWalk(self, query, start, (), seen, pages_left, page_size)
+                for game_id in older:
+                    crawled.append(game_id)
+                    yield game_id
+                complete = older.reason == "end"
+        finally:
+            # A crawl that stopped before reaching the known games would lose
+            # them, so it's only kept if there weren't any
+            if self.store is not None and (walk.reason is not None or not known):
+                self.store.save_crawl(query, crawled, complete, page_size)
@@ -0,0 +1,271 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = os.path.join(SCRIPT_DIR, "cache", "games.sqlite3")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS maps ("
+    " map_id INTEGER PRIMARY KEY,"
+    " name TEXT)",
+    "CREATE TABLE IF NOT EXISTS cos ("
+    " co_id INTEGER PRIMARY KEY,"
+    " name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS games ("
+    " game_id INTEGER PRIMARY KEY,"
+    " map_id INTEGER REFERENCES maps (map_id),"
+    " game_type TEXT)",
+    # One row per analysed player in a game. `turns` is how many of their
+    # turns were asked for (short games may have fewer).
+    "CREATE TABLE IF NOT EXISTS players ("
+    " game_id INTEGER NOT NULL REFERENCES games (game_id),"
+    " username TEXT NOT NULL COLLATE NOCASE,"
+    " co_id INTEGER REFERENCES cos (co_id),"
+    " player_num INTEGER NOT NULL,"
+    " turns INTEGER NOT NULL,"
+    " analysed_at REAL NOT NULL,"
+    " PRIMARY KEY (game_id, username))",
+    "CREATE TABLE IF NOT EXISTS turns ("
+    " game_id INTEGER NOT NULL,"
+    " username TEXT NOT NULL COLLATE NOCASE,"
+    " turn INTEGER NOT NULL,"
+    " day INTEGER NOT NULL,"
+    " leftover_funds INTEGER,"
+    " income INTEGER,"
+    " captures INTEGER NOT NULL,"
+    " PRIMARY KEY (game_id, username, turn))",
+    "CREATE TABLE IF NOT EXISTS builds ("
+    " game_id INTEGER NOT NULL,"
+    " username TEXT NOT NULL COLLATE NOCASE,"
+    " turn INTEGER NOT NULL,"
+    " unit_name TEXT NOT NULL,"
+    " count INTEGER NOT NULL,"
+    " PRIMARY KEY (game_id, username, turn, unit_name))",
+    # Results of each completed games search, newest first, so the next crawl
+    # can stop where this one started. `complete` means it reached the end.
+    "CREATE TABLE IF NOT EXISTS crawls ("
+    " query TEXT PRIMARY KEY,"
+    " complete INTEGER NOT NULL,"
+    " page_size INTEGER,"
+    " crawled_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS crawled_games ("
+    " query TEXT NOT NULL,"
+    " position INTEGER NOT NULL,"
+    " game_id INTEGER NOT NULL,"
+    " PRIMARY KEY (query, position))",
+    "CREATE INDEX IF NOT EXISTS players_username ON players (username)",
+    "CREATE INDEX IF NOT EXISTS players_co ON players (co_id)",
+    "CREATE INDEX IF NOT EXISTS games_map ON games (map_id)",
+]
+
+
+class GameStore():
+    """
+    Everything the player analyser has worked out about each game, so a game
+    is only ever downloaded and analysed once per player. Holds the same
+    per-turn records as `export.TURN_FIELDS`, and answers questions like "this
+    player's openings as Sonja on map X" without touching the network.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def has_game(self, game_id: str, username: str, turns: int) -> bool:
+        """
+        Whether at least `turns` of the player's turns in this game were analysed.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM players WHERE game_id = ? AND username = ? AND turns >= ?",
+                (int(game_id), username, turns),
+            ).fetchone()
+        return row is not None
+
+    def add_game(
+        self,
+        game_id: str,
+        username: str,
+        turns: int,
+        records: List[Dict],
+        map_id: Optional[str] = None,
+        game_type: Optional[str] = None,
+    ) -> None:
+        """
+        Save one player's turn records for a game, replacing anything saved
+        for them before. Only save games that were analysed as far as `turns`
+        (or to the end), since `has_game` takes them as done.
+        """
+        if not records:
+            return
+        game_id = int(game_id)
+        map_id = int(map_id) if map_id is not None else None
+
+        with self._lock, self._db:
+            if map_id is not None:
+                self._db.execute("INSERT OR IGNORE INTO maps (map_id) VALUES (?)", (map_id,))
+            self._db.execute(
+                "INSERT INTO games (game_id, map_id, game_type) VALUES (?, ?, ?)"
+                " ON CONFLICT (game_id) DO UPDATE SET"
+                " map_id = COALESCE(excluded.map_id, map_id), game_type = COALESCE(excluded.game_type, game_type)",
+                (game_id, map_id, game_type),
+            )
+            self._db.execute("INSERT OR IGNORE INTO cos (name) VALUES (?)", (records[0]["co"],))
+            (co_id,) = self._db.execute("SELECT co_id FROM cos WHERE name = ?", (records[0]["co"],)).fetchone()
+
+            for table in ("turns", "builds"):
+                self._db.execute(f"DELETE FROM {table} WHERE game_id = ? AND username = ?", (game_id, username))
+            self._db.execute(
+                "INSERT OR REPLACE INTO players (game_id, username, co_id, player_num, turns, analysed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (game_id, username, co_id, records[0]["turn"] % 2, turns, time.time()),
+            )
+            self._db.executemany(
+                "INSERT INTO turns (game_id, username, turn, day, leftover_funds, income, captures)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (game_id, username, record["turn"], record["day"], record["leftover_funds"], record["income"], record["captures"])
+                    for record in records
+                ],
+            )
+            self._db.executemany(
+                "INSERT INTO builds (game_id, username, turn, unit_name, count) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (game_id, username, record["turn"], unit_name, count)
+                    for record in records
+                    for unit_name, count in record["units_built"].items()
+                ],
+            )
+
+    def records(self, game_id: str, username: str) -> List[Dict]:
+        """
+        A player's turn records for one game, as they were given to `add_game`.
+        """
+        game_id = int(game_id)
+        with self._lock:
+            turns = self._db.execute(
+                "SELECT p.username, cos.name, t.turn, t.day, t.leftover_funds, t.income, t.captures"
+                " FROM turns t"
+                " JOIN players p USING (game_id, username)"
+                " LEFT JOIN cos USING (co_id)"
+                " WHERE t.game_id = ? AND t.username = ?"
+                " ORDER BY t.turn",
+                (game_id, username),
+            ).fetchall()
+            builds = self._db.execute(
+                "SELECT turn, unit_name, count FROM builds WHERE game_id = ? AND username = ? ORDER BY rowid",
+                (game_id, username),
+            ).fetchall()
+
+        units_built: Dict[int, Dict[str, int]] = {}
+        for turn, unit_name, count in builds:
+            units_built.setdefault(turn, {})[unit_name] = count
+
+        return [
+            {
+                "game_id": game_id,
+                "player": player,
+                "co": co,
+                "turn": turn,
+                "day": day,
+                "leftover_funds": leftover_funds,
+                "income": income,
+                "captures": captures,
+                "units_built": units_built.get(turn, {}),
+            }
+            for player, co, turn, day, leftover_funds, income, captures in turns
+        ]
+
+    def unit_counts(
+        self,
+        username: Optional[str] = None,
+        co: Optional[str] = None,
+        map_id: Optional[str] = None,
+        turns: Optional[int] = None,
+    ) -> Tuple[int, Dict[str, int]]:
+        """
+        How many games match, and how many of each non-infantry unit was built
+        in them within the player's first `turns` turns. Any filter can be left
+        out.
+        """
+        conditions = []
+        params: List = []
+        if username is not None:
+            conditions.append("p.username = ?")
+            params.append(username)
+        if co is not None:
+            conditions.append("cos.name = ? COLLATE NOCASE")
+            params.append(co)
+        if map_id is not None:
+            conditions.append("g.map_id = ?")
+            params.append(int(map_id))
+        if turns is not None:
+            # Only games analysed at least this far
+            conditions.append("p.turns >= ?")
+            params.append(turns)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        matching = (
+            "SELECT p.game_id, p.username, p.player_num FROM players p"
+            " JOIN games g USING (game_id)"
+            " LEFT JOIN cos USING (co_id)" + where
+        )
+        turn_limit = ""
+        if turns is not None:
+            turn_limit = " AND b.turn < ? * 2 + m.player_num"
+
+        with self._lock:
+            (games,) = self._db.execute(f"SELECT COUNT(*) FROM ({matching})", params).fetchone()
+            rows = self._db.execute(
+                f"SELECT b.unit_name, SUM(b.count) FROM ({matching}) m"
+                " JOIN builds b ON b.game_id = m.game_id AND b.username = m.username"
+                " WHERE b.unit_name != 'Infantry'" + turn_limit +
+                " GROUP BY b.unit_name ORDER BY SUM(b.count) DESC",
+                params + ([turns] if turns is not None else []),
+            ).fetchall()
+
+        return games, dict(rows)
+
+    def crawl(self, query: str) -> Tuple[List[str], bool, Optional[int]]:
+        """
+        The game IDs found by the last crawl of a search, newest first, whether
+        it reached the end of the results, and how many results there are per
+        page (if known).
+        """
+        with self._lock:
+            row = self._db.execute("SELECT complete, page_size FROM crawls WHERE query = ?", (query,)).fetchone()
+            game_ids = self._db.execute(
+                "SELECT game_id FROM crawled_games WHERE query = ? ORDER BY position",
+                (query,),
+            ).fetchall()
+        if row is None:
+            return [], False, None
+        return [str(game_id) for (game_id,) in game_ids], bool(row[0]), row[1]
+
+    def save_crawl(self, query: str, game_ids: List[str], complete: bool, page_size: Optional[int] = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO crawls (query, complete, page_size, crawled_at) VALUES (?, ?, ?, ?)",
+                (query, int(complete), page_size, time.time()),
+            )
+            self._db.execute("DELETE FROM crawled_games WHERE query = ?", (query,))
+            self._db.executemany(
+                "INSERT INTO crawled_games (query, position, game_id) VALUES (?, ?, ?)",
+                [(query, position, int(game_id)) for position, game_id in enumerate(game_ids)],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,118 @@
+"""
+Running opening statistics over any number of games. Each game is folded into a
+handful of counters and then forgotten, so memory use doesn't grow with the
+number of games (only its ID is kept). The counters can be saved as a
+checkpoint, to resume a long scan or add newer games to it later.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+import json
+import os
+
+
+class OpeningStats():
+
+    def __init__(self):
+        self.games = 0
+        # Every game folded in, so a later scan only adds the ones it hasn't
+        self.game_ids: Set[str] = set()
+        # CO: {unit name: number built}
+        self.units_by_co: Dict[str, Dict[str, int]] = {}
+        # Unit name: how many players built it as their first non-infantry unit
+        self.first_unit: Dict[str, int] = {}
+        # Day: [captures made that day, players who played that day]
+        self.captures_by_day: Dict[int, List[int]] = {}
+
+    def add_game(self, game_id: str, player_cos: Dict[int, str], turns: Iterable[Tuple[int, int, Dict[str, int], int]]) -> None:
+        """
+        Fold in one game. `turns` gives `(players_id, day, units_built,
+        captures)` for each turn, in order.
+        """
+        seen_first_unit = set()
+
+        for players_id, day, units_built, captures in turns:
+            co = player_cos.get(players_id, "Unknown")
+            co_units = self.units_by_co.setdefault(co, {})
+            for unit_name, num in units_built.items():
+                co_units[unit_name] = co_units.get(unit_name, 0) + num
+                if unit_name != "Infantry" and players_id not in seen_first_unit:
+                    seen_first_unit.add(players_id)
+                    self.first_unit[unit_name] = self.first_unit.get(unit_name, 0) + 1
+
+            day_captures = self.captures_by_day.setdefault(day, [0, 0])
+            day_captures[0] += captures
+            day_captures[1] += 1
+
+        self.games += 1
+        self.game_ids.add(game_id)
+
+    def unit_ratios_by_co(self) -> Dict[str, Dict[str, str]]:
+        """
+        Share of each non-infantry unit, for every CO.
+        """
+        ratios = {}
+        for co, units in sorted(self.units_by_co.items()):
+            units = {name: num for name, num in units.items() if name != "Infantry"}
+            total = sum(units.values())
+            if total:
+                ratios[co] = {
+                    name: str(round(num / total * 100, 2)) + "%"
+                    for name, num in sorted(units.items(), key=lambda item: -item[1])
+                }
+        return ratios
+
+    def capture_pace(self) -> Dict[int, float]:
+        """
+        Average captures each day, per player.
+        """
+        return {
+            day: round(captures / players, 2)
+            for day, (captures, players) in sorted(self.captures_by_day.items())
+        }
+
+    def print_report(self) -> None:
+        print(f"==OPENINGS ACROSS {self.games} GAMES==")
+        print("Unit ratios by CO:")
+        for co, ratios in self.unit_ratios_by_co().items():
+            print(f"  {co}: {ratios}")
+        print("First non-infantry unit:")
+        for unit_name, num in sorted(self.first_unit.items(), key=lambda item: -item[1]):
+            print(f"  {unit_name}: {num}")
+        print("Average captures per player, by day:")
+        for day, captures in self.capture_pace().items():
+            print(f"  Day {day}: {captures}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "games": self.games,
+            "game_ids": sorted(self.game_ids),
+            "units_by_co": self.units_by_co,
+            "first_unit": self.first_unit,
+            "captures_by_day": self.captures_by_day,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "OpeningStats":
+        stats = cls()
+        stats.games = data["games"]
+        # Older checkpoints only know the last game, not which games they have
+        stats.game_ids = set(data.get("game_ids", []))
+        stats.units_by_co = data["units_by_co"]
+        stats.first_unit = data["first_unit"]
+        # JSON keys are always strings
+        stats.captures_by_day = {int(day): value for day, value in data["captures_by_day"].items()}
+        return stats
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "OpeningStats":
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -1,15 +1,32 @@
 #!/usr/bin/env python3
 
+from action_pipeline import ActionPipeline, Captures, UnitsBuilt, current_day
+from awbw_api import fetch_turns, get_turn_count, load_replay
+from replay_archive import ReplayArchive, find_archives
+from session import load_creds, saved_session
+from spatial_index import FIRST_UNITS, Heatmaps, SpatialIndex, require_numpy
 from enum import Enum
-import json
-import html
-import re
+from export import TURN_FIELDS, RecordWriter, open_writer
+from game_crawler import GameCrawler
+from game_store import DEFAULT_STORE_PATH, GameStore
+from opening_stats import OpeningStats
+from transport import DEFAULT_RATE, Transport, set_default_transport
+from turn_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, TurnCache
+from dataclasses import asdict
+from typing import Callable, Iterable, Iterator, Optional
+import argparse
+import batch
+import contextlib
+import io
+import itertools
 import os
+import profiling
 import sys
-import requests
 
 # Analyse user's opening strategy
 
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+
 
 class GameType(Enum):
     ALL = "all"
@@ -18,50 +35,68 @@ class GameType(Enum):
     HIGH_FUNDS = "hf"
 
 
-def get_user_replays(username: str, game_type: GameType = GameType.ALL):
-    response = requests.get(
-        f"https://awbw.amarriner.com/gamescompleted.php?start=1&username={username}&type={game_type.value}",
-        cookies=cookie,
-    )
-    content = html.unescape(response.text)
-
-    pattern = re.compile(r'game.php\?games_id=(\d+)&ndx=0')
-    game_ids = []
-    for game_id in re.findall(pattern, content):
-        game_ids.append(game_id)
-
-    return game_ids
-
-
-def get_map_replays(map_id: str, game_type: GameType = GameType.ALL):
-    response = requests.get(
-        f"https://awbw.amarriner.com/gamescompleted.php?maps_id={map_id}",
-        cookies=cookie,
-    )
-    content = html.unescape(response.text)
-
-    pattern = re.compile(r'game.php\?games_id=(\d+)&ndx=0')
-    game_ids = []
-    for game_id in re.findall(pattern, content):
-        game_ids.append(game_id)
-
-    return game_ids
-
-
-def analyse_game(game_id: str, player: str, turns: int):
+def iter_completed_games(query: str, max_pages: Optional[int] = 1, store: Optional[GameStore] = None) -> Iterator[str]:
+    """
+    Game IDs from gamescompleted.php, newest first. `query` is the search,
+    e.g: "username=someone&type=fog". Reads up to `max_pages` pages (None for
+    every page). With a store, games found by an earlier search are remembered,
+    so only pages with games completed since then are downloaded.
+    """
+    return GameCrawler(cookie, store).iter_games(query, max_pages)
+
+
+def get_user_replays(
+    username: str,
+    game_type: GameType = GameType.ALL,
+    max_pages: Optional[int] = 1,
+    max_games: Optional[int] = None,
+    map_id: Optional[str] = None,
+    store: Optional[GameStore] = None,
+):
+    """
+    Game IDs from the user's completed games (on one map, if given), newest
+    first. Reads `max_pages` pages of results (None for the user's entire
+    history), stopping early once `max_games` have been found.
+    """
+    query = f"username={username}&type={game_type.value}"
+    if map_id is not None:
+        query += f"&maps_id={map_id}"
+    game_ids = iter_completed_games(query, max_pages, store)
+    return list(itertools.islice(game_ids, max_games))
+
+
+def get_map_replays(
+    map_id: str,
+    game_type: GameType = GameType.ALL,
+    max_pages: Optional[int] = 1,
+    max_games: Optional[int] = None,
+    store: Optional[GameStore] = None,
+):
+    game_ids = iter_completed_games(f"maps_id={map_id}&type={game_type.value}", max_pages, store)
+    return list(itertools.islice(game_ids, max_games))
+
+
+def analyse_game(
+    game_id: str,
+    player: str,
+    turns: int,
+    workers: int = 1,
+    archive: Optional[ReplayArchive] = None,
+    export: Optional[Callable[[dict], None]] = None,
+) -> dict[str, int]:
+    """
+    Print the player's build order for their first `turns` turns, and return
+    how many of each non-infantry unit they built. Reads the game from
+    `archive` instead of downloading it, if given. Each turn's record (see
+    `export.TURN_FIELDS`) is passed to `export` as soon as it is analysed.
+    """
     # Get the first turn, so we can find info like player name, CO, etc.
-    body = {
-        "gameId": game_id,
-        "turn": 0,
-    }
-
-    response = requests.post(
-        "https://awbw.amarriner.com/api/game/load_replay.php",
-        cookies=cookie,
-        json=body,
-    )
     try:
-        players = list(response.json()["gameState"]["players"].values())
+        if archive is not None:
+            turn_json = archive.get_turn(0)
+        else:
+            turn_json = load_replay(game_id, 0, cookie, cache)
+        players = list(turn_json["gameState"]["players"].values())
     except Exception:
         return {}
 
@@ -75,93 +110,201 @@ def analyse_game(game_id: str, player: str, turns: int):
 
     total_value = 0
     all_units = {}
-    unit_count = 0
-    for turn in range(0 + player_num, (turns * 2) + player_num, 2):
-        units, captures, income = analyse_turn(game_id, turn)
+    analysed = 0
+    end_turn = (turns * 2) + player_num
+    player_turns = range(0 + player_num, game_turn_count(game_id, end_turn, archive), 2)
+    if player_turns and player_turns[0] == 0:
+        # Already have turn 0 - don't download or decode it again
+        turn_jsons = itertools.chain([(0, turn_json)], iter_turns(game_id, player_turns[1:], workers, archive))
+    else:
+        turn_jsons = iter_turns(game_id, player_turns, workers, archive)
+    for turn, turn_json in turn_jsons:
+        units, captures, income = analyse_turn(game_id, turn, turn_json)
         if units is None or income is None:
-            if turn <= 1:
-                print("No game info")
-                return {}
             break
+        analysed += 1
         total_value += income
+        if export is not None:
+            export(turn_record(game_id, player, player_co, turn, turn_json, units, captures))
         print(f"Total value: {total_value}")
         for unit, num in units.items():
             if unit == "Infantry":
                 continue
-            unit_count += num
             if unit not in all_units:
                 all_units[unit] = num
             else:
                 all_units[unit] += num
 
-    unit_ratios = {}
-    for key, val in all_units.items():
-        unit_ratios[key] = str(round(val / unit_count * 100, 2)) + "%"
+    if not analysed:
+        print("No game info")
+        return {}
 
     print(f"=={turns}-TURN RATIOS==")
-    print(unit_ratios or "No non-infantry units produced")
+    print(unit_ratios(all_units) or "No non-infantry units produced")
     print()
 
-    return unit_ratios
+    return all_units
+
+
+def recall_game(
+    game_id: str,
+    player: str,
+    turns: int,
+    store: GameStore,
+    export: Optional[Callable[[dict], None]] = None,
+) -> dict[str, int]:
+    """
+    Like `analyse_game`, for a game that is already in the store. Nothing is
+    downloaded.
+    """
+    records = store.records(game_id, player)
+    end_turn = (turns * 2) + records[0]["turn"] % 2
+    records = [record for record in records if record["turn"] < end_turn]
+    print(f"ANALYSING GAME {game_id}. {player} playing as {records[0]['co']} (from the store)")
 
+    all_units = {}
+    for record in records:
+        if export is not None:
+            export(record)
+        for unit, num in record["units_built"].items():
+            if unit != "Infantry":
+                all_units[unit] = all_units.get(unit, 0) + num
 
-def analyse_turn(game_id: str, turn: int) -> tuple[dict[str, int], int, int] | tuple[None, None, None]:
-    body = {
-        "gameId": game_id,
+    print(f"=={turns}-TURN RATIOS==")
+    print(unit_ratios(all_units) or "No non-infantry units produced")
+    print()
+
+    return all_units
+
+
+def analyse_new_game(
+    game_id: str,
+    player: str,
+    turns: int,
+    workers: int,
+    store: Optional[GameStore],
+    export: Optional[Callable[[dict], None]] = None,
+    map_id: Optional[str] = None,
+    game_type: Optional[GameType] = None,
+) -> dict[str, int]:
+    """
+    `analyse_game`, but with the store: games that are already in it aren't
+    analysed again, and new ones are saved to it.
+    """
+    if store is None:
+        return analyse_game(game_id, player, turns, workers, export=export)
+    if store.has_game(game_id, player, turns):
+        return recall_game(game_id, player, turns, store, export)
+
+    records = []
+
+    def record(turn_record: dict):
+        records.append(turn_record)
+        if export is not None:
+            export(turn_record)
+
+    # Raises if the game can't be read in full, so only whole games are stored
+    unit_counts = analyse_game(game_id, player, turns, workers, export=record)
+    store.add_game(game_id, player, turns, records, map_id, game_type.value if game_type else None)
+    return unit_counts
+
+
+def turn_record(
+    game_id: str,
+    player: str,
+    player_co: str,
+    turn: int,
+    turn_json: dict,
+    units_built: dict[str, int],
+    captures: int,
+) -> dict:
+    game_state = turn_json["gameState"]
+    player_info = game_state["players"][str(game_state["currentTurnPId"])]
+    return {
+        "game_id": int(game_id),
+        "player": player,
+        "co": player_co,
         "turn": turn,
+        "day": current_day(turn, turn_json),
+        "leftover_funds": player_info["players_funds"] - player_info["players_income"],
+        "income": player_info["players_income"],
+        "captures": captures,
+        "units_built": units_built,
     }
 
-    response = requests.post(
-        "https://awbw.amarriner.com/api/game/load_replay.php",
-        cookies=cookie,
-        json=body,
-    )
-
-    if response.status_code != 200:
-        return None, None, None
-    if "err" in response.json():
-        print(response.json()["message"])
-        return None, None, None
 
-    units_built, captures = analyse_actions(response.json())
+def game_turn_count(game_id: str, limit: int, archive: Optional[ReplayArchive] = None) -> int:
+    """
+    How many turns the game has, up to `limit`, so we never ask for turns
+    past the end of the game.
+    """
+    if archive is not None:
+        return min(len(archive), limit)
+    return get_turn_count(game_id, cookie, cache, limit=limit)
+
+
+def unit_ratios(unit_counts: dict[str, int]) -> dict[str, str]:
+    unit_count = sum(unit_counts.values())
+    ratios = {}
+    for key, val in unit_counts.items():
+        ratios[key] = str(round(val / unit_count * 100, 2)) + "%"
+    return ratios
+
+
+def iter_turns(
+    game_id: str,
+    turns: Iterable[int],
+    workers: int = 1,
+    archive: Optional[ReplayArchive] = None,
+) -> Iterator[tuple[int, dict]]:
+    """
+    Like `fetch_turns`, but reads from `archive` if given. A turn that can't be
+    read is reported and raised, so a game is never quietly cut short.
+    """
+    try:
+        if archive is not None:
+            for turn in turns:
+                yield turn, archive.get_turn(turn)
+        else:
+            yield from fetch_turns(game_id, turns, cookie, cache, workers=workers)
+    except Exception as e:
+        print(f"Could not read game {game_id}: {e}")
+        raise
+
+
+def analyse_turn(
+    game_id: str,
+    turn: int,
+    turn_json: Optional[dict] = None,
+) -> tuple[dict[str, int], int, int] | tuple[None, None, None]:
+    if turn_json is None:
+        try:
+            turn_json = load_replay(game_id, turn, cookie, cache)
+        except RuntimeError as e:
+            print(e)
+            return None, None, None
+        except Exception:
+            return None, None, None
+
+    with profiling.phase("analyse_actions", turn):
+        units_built, captures = analyse_actions(turn_json, turn)
 
     # Funds leftover from LAST turn
-    pid = str(response.json()["gameState"]["currentTurnPId"])
-    player_info = response.json()["gameState"]["players"][pid]
+    pid = str(turn_json["gameState"]["currentTurnPId"])
+    player_info = turn_json["gameState"]["players"][pid]
     funds = player_info["players_funds"]
     income = player_info["players_income"]
-    print(f"Day {(turn // 2) + 1}. ${funds - income} leftover + ${income}. Captures: {captures}.")
+    print(f"Day {current_day(turn, turn_json)}. ${funds - income} leftover + ${income}. Captures: {captures}.")
 
     return units_built, captures, income
 
 
-def analyse_actions(response: dict):
-    units_built = {}
-    captures = 0
+def analyse_actions(response: dict, turn: int = 0):
+    units_built = UnitsBuilt()
+    captures = Captures(verbose=True)
+    ActionPipeline([units_built, captures]).feed(turn, response)
 
-    for action in response["actions"]:
-        action_type = action["action"]
-        # BUILD
-        if action_type == "Build":
-            unit_name = action["newUnit"]["units_name"]
-            if unit_name in units_built:
-                units_built[unit_name] += 1
-            else:
-                units_built[unit_name] = 1
-        # CAPTURE
-        if action_type == "Capt":
-            if action["buildingInfo"]["buildings_capture"] == 20:
-                if "com tower" in action["buildingInfo"]["terrain_name"].lower():
-                    print("Com tower captured")
-                    # Don't count com towers for income
-                    continue
-                if action["buildingInfo"]["terrain_name"].lower().endswith("lab"):
-                    print("Lab captured. Why?")
-                    # Don't count labs at all
-                    continue
-                captures += 1
-
-    return units_built, captures
+    return units_built.turn_units, captures.turn_captures
 
 
 def debug_action(action):
@@ -175,38 +318,442 @@ def debug_action(action):
         print(f"Move {unit_name}.")
 
 
-def setup():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    cookie = json.load(open(script_dir + "/creds.json"))
-    if cookie["awbw_password"] is None:
-        print(
-            "Please get a password using F12 dev tools.\n",
-            "It should start with '%2A' or '*', followed by 40 hex characters.\n",
-            "Put it in creds.json."
-        )
+def setup(require_password: bool = True):
+    try:
+        cookie = load_creds(require_password)
+    except RuntimeError as e:
+        print(e, "Put it in creds.json.")
         exit(1)
 
+    # Use the saved session if there is one. If not, we log in when a
+    # response shows we need to.
+    cookie.update(saved_session(cookie) or {})
     return cookie
 
 
-if __name__ == "__main__":
-    cookie = setup()
-    if len(sys.argv) > 1:
-        if sys.argv[1] in ("--help", "-h"):
-            print("Usage: {} [username]".format(sys.argv[0]))
-            sys.exit(1)
-        player_name = sys.argv[1]
-    else:
-        player_name = cookie["awbw_username"]
+def analyse_map_game(
+    game_id: str,
+    days: int,
+    workers: int = 1,
+    index: Optional[SpatialIndex] = None,
+) -> tuple[dict[int, str], list[tuple[int, int, dict[str, int], int]]] | None:
+    """
+    Both players' builds and captures for the first `days` days of a game, as
+    `({players_id: CO}, [(players_id, day, units_built, captures), ...])`.
+    Unit positions are recorded in `index`, if given.
+    """
+    try:
+        first_turn_json = load_replay(game_id, 0, cookie, cache)
+    except Exception as e:
+        print(e)
+        return None
+
+    game_state = first_turn_json["gameState"]
+    player_cos = {int(player["players_id"]): player["co_name"] for player in game_state["players"].values()}
+
+    turns = []
+    positions = ActionPipeline([index] if index is not None else [])
+    try:
+        turn_count = game_turn_count(game_id, days * 2)
+        later_turns = iter_turns(game_id, range(1, turn_count), workers)
+        for turn, turn_json in itertools.chain([(0, first_turn_json)], later_turns):
+            game_state = turn_json["gameState"]
+            with profiling.phase("analyse_actions", turn):
+                units_built, captures = analyse_actions(turn_json, turn)
+                positions.feed(turn, turn_json)
+            turns.append((int(game_state["currentTurnPId"]), current_day(turn, turn_json), units_built, captures))
+    except Exception:
+        # Part of a game would skew the stats
+        return None
+
+    return player_cos, turns
+
+
+def analyse_map(
+    map_id: str,
+    game_type: GameType,
+    days: int,
+    workers: int = 1,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_every: int = 10,
+    max_games: Optional[int] = None,
+    heatmap_units: Optional[list[str]] = None,
+    username: Optional[str] = None,
+    store: Optional[GameStore] = None,
+) -> OpeningStats:
+    """
+    Scan every completed game on a map (only `username`'s, if given), folding
+    each one into running opening stats, and heatmaps of where the first few of
+    each of `heatmap_units` went. Everything is checkpointed as it goes, and
+    the next scan only adds the games that aren't in the checkpoint yet - the
+    rest of an interrupted scan, and any games completed since.
+    """
+    query = f"maps_id={map_id}&type={game_type.value}"
+    name = f"map_{map_id}_{game_type.value}"
+    if username is not None:
+        query += f"&username={username}"
+        name += f"_{username}"
+    checkpoint_path = checkpoint_path or os.path.join(CHECKPOINT_DIR, f"{name}.json")
+    stats = OpeningStats.load(checkpoint_path)
+    heatmaps_path = os.path.splitext(checkpoint_path)[0] + ".heatmaps.json"
+    heatmaps = Heatmaps.load(heatmaps_path, heatmap_units, FIRST_UNITS) if heatmap_units else None
+
+    game_ids = iter_completed_games(query, max_pages=None, store=store)
+    if stats.games:
+        print(f"Adding to the {stats.games} games already scanned")
+    # The stats and heatmaps may have been started at different times (e.g:
+    # --heatmap added to an earlier scan), so each gets the games it's missing
+    new_game_ids = (
+        game_id for game_id in game_ids
+        if game_id not in stats.game_ids or (heatmaps is not None and game_id not in heatmaps.game_ids)
+    )
 
-    # TODO - arg to change mode, or turn numbers
-    replays = get_user_replays(player_name, GameType.FOG)
-    # replays = get_map_replays(player_name, GameType.FOG)
+    scanned = 0
+    try:
+        for game_id in itertools.islice(new_game_ids, max_games):
+            # Only the totals matter here, not each game's commentary
+            index = SpatialIndex() if heatmaps is not None else None
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = analyse_map_game(game_id, days, workers, index)
+            # Games that couldn't be read are tried again next time
+            if result is not None:
+                if game_id not in stats.game_ids:
+                    stats.add_game(game_id, *result)
+                if heatmaps is not None and game_id not in heatmaps.game_ids:
+                    heatmaps.add_game(game_id, index, days * 2, username)
+
+            scanned += 1
+            sys.stdout.write(f"\rScanned {scanned} games, {stats.games} in total...")
+            sys.stdout.flush()
+            if scanned % checkpoint_every == 0:
+                stats.save(checkpoint_path)
+                if heatmaps is not None:
+                    heatmaps.save(heatmaps_path)
+    finally:
+        stats.save(checkpoint_path)
+        if heatmaps is not None:
+            heatmaps.save(heatmaps_path)
+        print()
+
+    stats.print_report()
+    if heatmaps is not None:
+        print()
+        heatmaps.print_report()
+    return stats
+
+
+def use_worker(worker: batch.Worker):
+    """
+    Runs once in each batch process, so its games use the process' own
+    connections and cache.
+    """
+    global cookie, cache
+    cookie = worker.cookie
+    cache = worker.cache
+    set_default_transport(worker.transport)
+
+
+def analyse_batch_game(
+    game_id: str,
+    player: str,
+    turns: int,
+    workers: int,
+    archive_path: Optional[str] = None,
+    export: bool = False,
+) -> tuple[dict[str, int], list[dict]]:
+    """
+    `analyse_game` in a batch process (see `batch.run_batch`). Also returns
+    the game's turn records, if exporting.
+    """
+    records: list[dict] = []
+    record = records.append if export else None
+    if archive_path is not None:
+        with ReplayArchive(archive_path) as archive:
+            unit_counts = analyse_game(archive.game_id, player, turns, workers, archive, record)
+    else:
+        unit_counts = analyse_game(game_id, player, turns, workers, export=record)
+    return unit_counts, records
+
+
+def analyse_games(
+    replays: list[str],
+    player: str,
+    turns: int,
+    processes: int,
+    workers: int,
+    rate: Optional[float],
+    from_archives: bool = False,
+    writer: Optional[RecordWriter] = None,
+    store: Optional[GameStore] = None,
+    map_id: Optional[str] = None,
+    game_type: Optional[GameType] = None,
+):
+    """
+    Analyse many games at once, then print the unit ratios across all of them.
+    With `from_archives`, `replays` are paths to replay archives. Each game's
+    turn records are written to `writer` as soon as the game is done. Games
+    already in `store` are read from there, and new ones are added to it.
+    """
+    total_units: dict[str, int] = {}
+    games = 0
+
+    def count_game(unit_counts: dict[str, int]):
+        nonlocal games
+        if unit_counts:
+            games += 1
+        for unit, num in unit_counts.items():
+            total_units[unit] = total_units.get(unit, 0) + num
+
+    if store is not None and not from_archives:
+        export = writer.write if writer is not None else None
+        new_replays = []
+        for replay in replays:
+            if store.has_game(replay, player, turns):
+                count_game(recall_game(replay, player, turns, store, export))
+            else:
+                new_replays.append(replay)
+        replays = new_replays
+
+    export = writer is not None or store is not None
+    jobs = []
+    for replay in replays:
+        if from_archives:
+            jobs.append((replay, analyse_batch_game, (None, player, turns, workers, replay, export)))
+        else:
+            jobs.append((replay, analyse_batch_game, (replay, player, turns, workers, None, export)))
+    for replay, result in batch.run_batch(jobs, processes, cookie, cache, rate, workers, use_worker):
+        if result is None:
+            # Stopped part way - storing it would have it taken as done next time
+            continue
+        unit_counts, records = result
+        if writer is not None:
+            for record in records:
+                writer.write(record)
+        if store is not None and not from_archives:
+            store.add_game(replay, player, turns, records, map_id, game_type.value if game_type else None)
+        count_game(unit_counts)
+
+    print(f"=={turns}-TURN RATIOS ACROSS {games} GAMES==")
+    print(unit_ratios(total_units) or "No non-infantry units produced")
+
+    return total_units
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a player's opening strategy in their completed games.")
+    parser.add_argument(
+        "username",
+        nargs="?",
+        help="The player to analyse. Defaults to your own username (from creds.json)."
+    )
+    parser.add_argument(
+        "--turns",
+        type=int,
+        default=12,
+        help="How many of the player's turns to analyse in each game (default 12)."
+    )
+    parser.add_argument(
+        "--type",
+        choices=[game_type.value for game_type in GameType],
+        default=GameType.FOG.value,
+        help="Which kind of games to analyse (default fog)."
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Analyse the player's entire history, several games at once, and show the overall ratios."
+    )
+    parser.add_argument(
+        "--max-games",
+        type=int,
+        help="Analyse at most this many of the most recent games."
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=4,
+        help="With --batch, how many games to analyse at once (default 4)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="How many turns of each game to download at once (default 2)."
+    )
+    parser.add_argument(
+        "--map",
+        metavar="MAP_ID",
+        help="Instead of a player, scan every completed game on this map and show opening stats for each CO."
+    )
+    parser.add_argument(
+        "--heatmap",
+        nargs="+",
+        metavar="UNIT",
+        help=f"With --map, also show where the first {FIRST_UNITS} of each of these units (e.g: Tank B-Copter) usually went. Needs numpy."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="FILE",
+        help="With --map, where to save progress. An interrupted scan carries on from here."
+    )
+    parser.add_argument(
+        "--from-archive",
+        nargs="+",
+        metavar="PATH",
+        help="Analyse replay archives (or directories of them) instead of the player's games on AWBW."
+    )
+    parser.add_argument(
+        "--on-map",
+        metavar="MAP_ID",
+        help="Only analyse the player's games on this map."
+    )
+    parser.add_argument(
+        "--query",
+        action="store_true",
+        help="Don't download anything - show the ratios across games already in the store. Filter with --co and --on-map."
+    )
+    parser.add_argument(
+        "--co",
+        help="With --query, only count games where the player was this CO."
+    )
+    parser.add_argument(
+        "--no-store",
+        action="store_true",
+        help="Analyse every game again, instead of reading games that were already analysed from the store."
+    )
+    parser.add_argument(
+        "--store-path",
+        default=DEFAULT_STORE_PATH,
+        help="Where to keep the store of analysed games."
+    )
+    parser.add_argument(
+        "--export",
+        metavar="FILE",
+        help="Also write every analysed turn (builds, funds, income, captures) to FILE, as .jsonl, .csv or .parquet (needs pyarrow)."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always download turns, instead of using the on-disk turn cache."
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="Where to keep the turn cache."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Maximum size of the turn cache, in MB. Least recently used turns are dropped first."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help=f"Maximum requests per second sent to AWBW, in total (default {DEFAULT_RATE}). Use 0 for no limit."
+    )
+    parser.add_argument(
+        "--profile",
+        "--stats",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Record time spent in each phase, per turn, and request latency. Prints a JSON summary at the end, or writes it to FILE."
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="FILE",
+        help="Run under cProfile, and save the stats to FILE. Only covers the main process."
+    )
+    args = parser.parse_args()
+    if args.export and args.map:
+        parser.error("--export can't be used with --map")
+    if args.query and args.no_store:
+        parser.error("--query needs the store")
+    if args.heatmap and not args.map:
+        parser.error("--heatmap only works with --map")
+    if args.heatmap:
+        try:
+            require_numpy()
+        except RuntimeError as e:
+            parser.error(str(e))
+
+    if args.profile:
+        profiling.enable()
+    with profiling.cprofile(args.cprofile):
+        if args.export:
+            with open_writer(args.export, TURN_FIELDS) as writer:
+                run(args, writer)
+        else:
+            run(args)
+
+    if args.profile:
+        profiling.write_summary(args.profile, {"cache": asdict(cache.stats) if cache is not None else None})
+
+
+def run(args: argparse.Namespace, writer: Optional[RecordWriter] = None):
+    global cookie, cache
+
+    export = writer.write if writer is not None else None
+
+    # Archives and the store don't need to log in
+    cookie = setup(require_password=not (args.from_archive or args.query))
+    cache = None if args.no_cache else TurnCache(args.cache_path, args.cache_size * 1024 * 1024)
+    set_default_transport(Transport(rate=args.rate, burst=args.workers))
+    player_name = args.username or cookie["awbw_username"]
+    store = None if args.no_store else GameStore(args.store_path)
+
+    if args.query:
+        games, unit_counts = store.unit_counts(player_name, args.co, args.on_map, args.turns)
+        print(f"=={args.turns}-TURN RATIOS ACROSS {games} STORED GAMES==")
+        print(unit_ratios(unit_counts) or "No non-infantry units produced")
+        return
+
+    if args.map:
+        analyse_map(
+            args.map, GameType(args.type), args.turns, args.workers, args.checkpoint,
+            max_games=args.max_games, heatmap_units=args.heatmap, username=args.username, store=store,
+        )
+        return
+
+    if args.from_archive:
+        # Entirely offline
+        archives = find_archives(args.from_archive)[:args.max_games]
+        if args.batch:
+            analyse_games(archives, player_name, args.turns, args.processes, args.workers, args.rate, True, writer)
+        else:
+            for path in archives:
+                with ReplayArchive(path) as archive:
+                    analyse_game(archive.game_id, player_name, args.turns, archive=archive, export=export)
+        return
+
+    game_type = GameType(args.type)
+    replays = get_user_replays(
+        player_name,
+        game_type,
+        max_pages=None if args.batch else 1,
+        max_games=args.max_games,
+        map_id=args.on_map,
+        store=store,
+    )
     if not replays:
         print("Could not find any games to analyse")
-    try:
+    elif args.batch:
+        analyse_games(
+            replays, player_name, args.turns, args.processes, args.workers, args.rate,
+            writer=writer, store=store, map_id=args.on_map, game_type=game_type,
+        )
+    else:
         for replay in replays:
-            analyse_game(replay, player_name, 12)
-    except Exception as e:
-        print("Exception. Exiting.")
-        print(e)
+            try:
+                analyse_new_game(replay, player_name, args.turns, args.workers, store, export, args.on_map, game_type)
+            except Exception as e:
+                print(f"Exception analysing game {replay}: {e}")
+    if cache is not None:
+        print(f"Turn cache: {cache.stats}")
+
+
+if __name__ == "__main__":
+    main()
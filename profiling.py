@@ -0,0 +1,191 @@
+"""
+Per-phase timing for the analysers. Nothing is recorded unless `enable()` has
+been called, so the hooks can stay in place in normal runs.
+
+    with profiling.phase("infer_turn_built"):
+        ...
+    profiling.count("units", len(units), turn=turn)
+"""
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import cProfile
+import json
+import threading
+import time
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+
+    def percentile(p: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(0.50),
+        "p90": percentile(0.90),
+        "p99": percentile(0.99),
+        "max": values[-1],
+    }
+
+
+class Profiler():
+    """
+    Wall time and call counts per phase (overall, and per turn), plus every
+    request's latency and size. Thread safe.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List[float]] = {}  # name: [seconds, calls]
+        self.counters: Dict[str, int] = {}
+        self.turns: Dict[int, Dict[str, Dict[str, List[float]]]] = {}
+        self.latencies: List[float] = []
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+
+    def _turn(self, turn: int) -> Dict[str, Dict[str, List[float]]]:
+        if turn not in self.turns:
+            self.turns[turn] = {"phases": {}, "counters": {}}
+        return self.turns[turn]
+
+    def add_phase(self, name: str, seconds: float, turn: Optional[int] = None, calls: int = 1) -> None:
+        with self._lock:
+            totals = self.phases.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+            if turn is not None:
+                totals = self._turn(turn)["phases"].setdefault(name, [0.0, 0])
+                totals[0] += seconds
+                totals[1] += calls
+
+    def add_count(self, name: str, amount: int, turn: Optional[int] = None) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if turn is not None:
+                counters = self._turn(turn)["counters"]
+                counters[name] = counters.get(name, 0) + amount
+
+    def add_request(self, seconds: float, size: int) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+            self.bytes_downloaded += size
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Raw numbers, which can be sent between processes and `merge`d.
+        """
+        with self._lock:
+            return {
+                "phases": {name: list(totals) for name, totals in self.phases.items()},
+                "counters": dict(self.counters),
+                "latencies": list(self.latencies),
+                "bytes_downloaded": self.bytes_downloaded,
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        for name, (seconds, calls) in snapshot["phases"].items():
+            self.add_phase(name, seconds, calls=calls)
+        for name, amount in snapshot["counters"].items():
+            self.add_count(name, amount)
+        with self._lock:
+            self.latencies.extend(snapshot["latencies"])
+            self.bytes_downloaded += snapshot["bytes_downloaded"]
+
+    def summary(self, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        def phases(totals: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+            return {
+                name: {"seconds": round(seconds, 6), "calls": calls}
+                for name, (seconds, calls) in sorted(totals.items())
+            }
+
+        with self._lock:
+            summary = {
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                "phases": phases(self.phases),
+                "counters": dict(self.counters),
+                "network": {
+                    "requests": len(self.latencies),
+                    "bytes_downloaded": self.bytes_downloaded,
+                    "latency": percentiles(self.latencies),
+                },
+                "turns": {
+                    turn: {"phases": phases(data["phases"]), "counters": data["counters"]}
+                    for turn, data in sorted(self.turns.items())
+                },
+            }
+        summary.update(extra or {})
+        return summary
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enable() -> Profiler:
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def current() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def phase(name: str, turn: Optional[int] = None) -> Iterator[None]:
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_phase(name, time.perf_counter() - start, turn)
+
+
+def count(name: str, amount: int = 1, turn: Optional[int] = None) -> None:
+    if _profiler is not None:
+        _profiler.add_count(name, amount, turn)
+
+
+def record_request(seconds: float, size: int) -> None:
+    if _profiler is not None:
+        _profiler.add_request(seconds, size)
+
+
+def write_summary(path: str, extra: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Write the JSON summary to `path`, or print it if `path` is "-".
+    """
+    summary = json.dumps(_profiler.summary(extra), indent=2)
+    if path == "-":
+        print(summary)
+    else:
+        with open(path, "w") as f:
+            f.write(summary)
+
+
+@contextmanager
+def cprofile(path: Optional[str]) -> Iterator[None]:
+    """
+    Run the block under cProfile and dump the stats to `path` (for
+    `python -m pstats`, snakeviz, etc). Does nothing without a path.
+    """
+    if not path:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
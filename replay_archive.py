@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Single-file replay archives, so games can be analysed without the AWBW API.
+
+An archive holds every turn's load_replay.php response, each compressed on its
+own, followed by an index of where each turn is. Any one turn can be read
+without decompressing the rest.
+
+    MAGIC | turn 0 | turn 1 | ... | index | footer
+
+The index is compressed JSON, and the footer gives its offset and length.
+
+Consecutive gameStates are mostly the same, so only every
+`keyframe_interval`th turn keeps its full gameState. The rest keep a diff
+against the turn before (see state_delta.py), and are rebuilt from the
+nearest keyframe when read.
+"""
+
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import argparse
+import json
+import json_codec
+import os
+import profiling
+import state_delta
+import struct
+import sys
+import threading
+import time
+import zlib
+
+if TYPE_CHECKING:
+    from turn_cache import TurnCache
+
+
+MAGIC = b"AWBWRPL2"
+# Every turn's full response - still readable
+MAGIC_V1 = b"AWBWRPL1"
+FOOTER = struct.Struct("<QQ8s")  # Index offset, index length, MAGIC
+ARCHIVE_EXTENSION = ".awbwreplay"
+
+# In place of "gameState", for turns between keyframes
+DELTA_KEY = "gameStateDelta"
+KEYFRAME_INTERVAL = 16
+
+
+class ReplayArchive():
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+
+        version = self._file.read(len(MAGIC))
+        if version not in (MAGIC, MAGIC_V1):
+            raise ValueError(f"{path} is not a replay archive")
+        self._file.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, index_length, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != version:
+            raise ValueError(f"{path} is truncated")
+
+        self.index = json.loads(zlib.decompress(self._read(index_offset, index_length)))
+        self.game_id: str = self.index["game_id"]
+        self.keyframe_interval: int = self.index.get("keyframe_interval", 1)
+        self._turns: List[Tuple[int, int]] = self.index["turns"]
+
+        # The last gameState that was rebuilt, so reading turns in order only
+        # applies one diff each
+        self._state: Optional[Tuple[int, Dict]] = None
+        self._state_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __enter__(self) -> "ReplayArchive":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _read(self, offset: int, length: int) -> bytes:
+        # pread doesn't move the file position, so threads can share the file
+        return os.pread(self._file.fileno(), length, offset)
+
+    def _load(self, turn: int) -> Dict:
+        return json_codec.loads(zlib.decompress(self._read(*self._turns[turn])))
+
+    def get_turn(self, turn: int) -> Dict:
+        """
+        Same as `load_replay` - raises a RuntimeError if the turn doesn't exist.
+
+        Unchanged parts of gameState are shared between turns, so treat the
+        result as read only.
+        """
+        if not 0 <= turn < len(self._turns):
+            raise RuntimeError(f"Turn {turn} is not in the archive ({len(self._turns)} turns)")
+        with profiling.phase("archive_read", turn):
+            turn_json = self._load(turn)
+            if DELTA_KEY in turn_json:
+                state = self._rebuild_state(turn, turn_json[DELTA_KEY])
+                turn_json = {
+                    ("gameState" if key == DELTA_KEY else key): (state if key == DELTA_KEY else value)
+                    for key, value in turn_json.items()
+                }
+            elif self.keyframe_interval > 1:
+                with self._state_lock:
+                    self._state = (turn, turn_json.get("gameState"))
+            return turn_json
+
+    def _rebuild_state(self, turn: int, patch: Optional[Dict]) -> Dict:
+        keyframe = turn - turn % self.keyframe_interval
+        with self._state_lock:
+            if self._state is not None and keyframe <= self._state[0] < turn:
+                state_turn, state = self._state
+            else:
+                state_turn, state = keyframe, self._load(keyframe)["gameState"]
+
+            for between in range(state_turn + 1, turn):
+                between_json = self._load(between)
+                if DELTA_KEY in between_json:
+                    state = state_delta.apply(state, between_json[DELTA_KEY])
+                else:
+                    state = between_json["gameState"]
+            state = state_delta.apply(state, patch)
+            self._state = (turn, state)
+        return state
+
+    def turns(self) -> Iterator[Tuple[int, Dict]]:
+        for turn in range(len(self._turns)):
+            yield turn, self.get_turn(turn)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def write_archive(
+    path: str,
+    game_id: str,
+    turns: Iterable[Dict],
+    level: int = 9,
+    keyframe_interval: int = KEYFRAME_INTERVAL,
+) -> int:
+    """
+    Write turns (in order, starting from turn 0) to an archive. Turns are
+    written as they arrive, so this never holds more than two in memory.
+    Returns the number of turns written.
+    """
+    index: Dict = {
+        "game_id": str(game_id),
+        "created": int(time.time()),
+        "keyframe_interval": keyframe_interval,
+        "turns": [],
+    }
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        previous_state = None
+        for turn, turn_json in enumerate(turns):
+            state = turn_json.get("gameState")
+            if turn % keyframe_interval and previous_state is not None and state is not None:
+                patch = state_delta.diff(previous_state, state)
+                # Keep the keys in the same order, so the turn reads back identically
+                turn_json = {
+                    (DELTA_KEY if key == "gameState" else key): (patch if key == "gameState" else value)
+                    for key, value in turn_json.items()
+                }
+            previous_state = state
+
+            data = zlib.compress(json_codec.dumps(turn_json), level)
+            index["turns"].append((f.tell(), len(data)))
+            f.write(data)
+
+        index_data = zlib.compress(json.dumps(index).encode(), level)
+        index_offset = f.tell()
+        f.write(index_data)
+        f.write(FOOTER.pack(index_offset, len(index_data), MAGIC))
+    os.replace(tmp_path, path)
+
+    return len(index["turns"])
+
+
+def archive_path(directory: str, game_id: str) -> str:
+    return os.path.join(directory, f"{game_id}{ARCHIVE_EXTENSION}")
+
+
+def find_archives(paths: Iterable[str]) -> List[str]:
+    """
+    Expand directories into the archives inside them.
+    """
+    archives = []
+    for path in paths:
+        if os.path.isdir(path):
+            archives.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.endswith(ARCHIVE_EXTENSION)
+            ))
+        else:
+            archives.append(path)
+    return archives
+
+
+def download_archive(game_id: str, path: str, cookie: Dict, cache: Optional["TurnCache"] = None, workers: int = 4) -> int:
+    # Reading archives shouldn't need any of the network code
+    from action_pipeline import current_day
+    from awbw_api import fetch_turns, get_turn_count
+
+    turn_count = get_turn_count(game_id, cookie, cache)
+
+    def turns() -> Iterator[Dict]:
+        for turn, turn_json in fetch_turns(game_id, range(turn_count), cookie, cache, workers=workers):
+            sys.stdout.write(f"\rDownloading game {game_id} day {current_day(turn, turn_json)}...")
+            sys.stdout.flush()
+            yield turn_json
+
+    count = write_archive(path, game_id, turns())
+    print(f"\rSaved {count} turns of game {game_id} to {path} ({os.path.getsize(path)} bytes)")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Save AWBW replays to single-file archives, for offline analysis.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    download = subparsers.add_parser("download", help="Download whole games into archives.")
+    download.add_argument("game_ids", nargs="+", help="The IDs of the games.")
+    download.add_argument("--output-dir", default=".", help="Where to save the archives.")
+    download.add_argument("--workers", type=int, default=4, help="How many turns to download at once.")
+
+    info = subparsers.add_parser("info", help="Show what is in archives.")
+    info.add_argument("paths", nargs="+", help="Archives, or directories of archives.")
+
+    repack = subparsers.add_parser("repack", help="Rewrite archives in the current (smaller) format.")
+    repack.add_argument("paths", nargs="+", help="Archives, or directories of archives.")
+    repack.add_argument(
+        "--keyframe-interval",
+        type=int,
+        default=KEYFRAME_INTERVAL,
+        help=f"Keep a full gameState every this many turns (default {KEYFRAME_INTERVAL}). Higher is smaller, but slower to jump around in."
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "download":
+        # Only needed for downloading
+        from session import get_cookie
+        from turn_cache import TurnCache
+
+        cookie = get_cookie()
+        cache = TurnCache()
+        os.makedirs(args.output_dir, exist_ok=True)
+        for game_id in args.game_ids:
+            download_archive(game_id, archive_path(args.output_dir, game_id), cookie, cache, args.workers)
+    elif args.command == "info":
+        for path in find_archives(args.paths):
+            with ReplayArchive(path) as archive:
+                print(
+                    f"{path}: game {archive.game_id}, {len(archive)} turns, {os.path.getsize(path)} bytes, "
+                    f"keyframe every {archive.keyframe_interval} turns"
+                )
+    elif args.command == "repack":
+        for path in find_archives(args.paths):
+            before = os.path.getsize(path)
+            with ReplayArchive(path) as archive:
+                turns = (turn_json for _, turn_json in archive.turns())
+                write_archive(path, archive.game_id, turns, keyframe_interval=args.keyframe_interval)
+            print(f"{path}: {before} -> {os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
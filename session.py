@@ -0,0 +1,184 @@
+"""
+Credentials (creds.json) and the AWBW session cookie, shared by every tool.
+
+Logging in is a round trip to the AWBW homepage, so the session cookie is
+saved to disk and reused until it expires. If AWBW stops treating a saved
+session as logged in before then, `revalidate` logs in again - only when a
+response shows it.
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from awbw_api import BASE_URL, CREDS_PATH
+
+if TYPE_CHECKING:
+    from transport import Transport
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_PATH = os.environ.get("AWBW_SESSION", os.path.join(SCRIPT_DIR, "cache", "session.json"))
+SESSION_COOKIE = "PHPSESSID"
+# How long to trust a session that AWBW didn't give an expiry for
+SESSION_SECONDS = 24 * 60 * 60
+# A session this new can't have expired yet, so it isn't worth replacing
+FRESH_LOGIN_SECONDS = 60
+
+# Actions that need a unit to exist when the turn starts. If a turn has one
+# of these, but no units at all, AWBW didn't see us as logged in.
+UNIT_ACTIONS = {"Move", "Fire", "Capt", "Join", "Load", "Unload", "Supply", "Repair", "Hide", "Unhide", "Launch", "Explode", "Delete"}
+
+_lock = threading.Lock()
+# Sessions this process logged in for: time logged in
+_logins: Dict[str, float] = {}
+# Sessions that have sent back units, so were logged in
+_working: Set[str] = set()
+# Turns without any units (like most first turns), from sessions that haven't
+# sent back units yet. If one of those sessions turns out to be logged out,
+# these were probably wrong too. Session: [(game_id, turn), ...]
+_unconfirmed: Dict[str, List[Tuple[str, int]]] = {}
+
+
+def load_creds(require_password: bool = True) -> Dict:
+    with open(CREDS_PATH) as f:
+        creds = json.load(f)
+    if require_password and creds.get("awbw_password") is None:
+        raise RuntimeError("Please get a password using F12 dev tools. It should start with '%2A' or '*', followed by 40 hex characters.")
+    return creds
+
+
+def creds_key(creds: Dict) -> Dict[str, str]:
+    """
+    What a saved session belongs to. The password is only kept as a hash.
+    """
+    return {
+        "base_url": BASE_URL,
+        "username": str(creds.get("awbw_username")).lower(),
+        "password_sha256": hashlib.sha256(str(creds.get("awbw_password")).encode()).hexdigest(),
+    }
+
+
+def saved_session(creds: Dict) -> Optional[Dict[str, str]]:
+    """
+    The saved session cookies for these credentials, or None if there are none
+    that haven't expired.
+    """
+    try:
+        with open(SESSION_PATH) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if saved.get("key") != creds_key(creds) or saved.get("expires", 0) <= time.time():
+        return None
+    return saved.get("cookies") or None
+
+
+def save_session(creds: Dict, cookies: Dict[str, str], expires: float) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(SESSION_PATH)), exist_ok=True)
+    tmp_path = f"{SESSION_PATH}.{os.getpid()}.tmp"
+    # Anyone with the session cookie is logged in as you
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"key": creds_key(creds), "cookies": cookies, "expires": expires}, f)
+    os.replace(tmp_path, SESSION_PATH)
+
+
+def login(creds: Dict, transport: Optional["Transport"] = None) -> Dict[str, str]:
+    """
+    Get a new PHPSESSID cookie (without it, 'units' is empty), and save it.
+    """
+    import profiling
+    from transport import default_transport
+
+    transport = transport or default_transport()
+    with profiling.phase("login"):
+        response = transport.get(BASE_URL + "/", cookies=creds)
+
+    cookies = {}
+    expires = time.time() + SESSION_SECONDS
+    for resp_cookie in response.cookies:
+        cookies[resp_cookie.name] = resp_cookie.value
+        if resp_cookie.name == SESSION_COOKIE and resp_cookie.expires:
+            expires = min(expires, resp_cookie.expires)
+
+    if SESSION_COOKIE in cookies:
+        _logins[cookies[SESSION_COOKIE]] = time.time()
+        save_session(creds, cookies, expires)
+    return cookies
+
+
+def get_cookie(transport: Optional["Transport"] = None) -> Dict:
+    """
+    Credentials plus session cookies, ready to send with every request. Only
+    logs in if there's no saved session.
+    """
+    cookie = load_creds()
+    with _lock:
+        cookie.update(saved_session(cookie) or login(cookie, transport))
+    return cookie
+
+
+def looks_logged_out(turn: int, turn_json: Dict) -> bool:
+    """
+    Whether a replay response looks like it was made without a session. Most
+    first turns can't tell, as nobody has units before they build any - only
+    predeployed units give it away.
+    """
+    if turn_json.get("gameState", {}).get("units"):
+        return False
+    # A unit built this turn can be deleted straight away
+    unit_actions = UNIT_ACTIONS if turn else UNIT_ACTIONS - {"Delete"}
+    return any(action.get("action") in unit_actions for action in turn_json.get("actions", ()))
+
+
+def note_response(sent_session: Optional[str], game_id: str, turn: int, turn_json: Dict) -> None:
+    """
+    Keep track of which sessions are known to work, and of the turns without
+    units that came from sessions that aren't (see `logged_out_turns`).
+    """
+    with _lock:
+        if turn_json.get("gameState", {}).get("units"):
+            _working.add(sent_session)
+            _unconfirmed.pop(sent_session, None)
+        elif sent_session not in _working:
+            _unconfirmed.setdefault(sent_session, []).append((str(game_id), turn))
+
+
+def logged_out_turns(sent_session: Optional[str]) -> List[Tuple[str, int]]:
+    """
+    The turns without units that came from a session that turned out to be
+    logged out. They can't be told apart from a real first turn, so anything
+    kept of them should be thrown away.
+    """
+    with _lock:
+        return _unconfirmed.pop(sent_session, [])
+
+
+def revalidate(cookie: Dict, sent_session: Optional[str], transport: Optional["Transport"] = None) -> bool:
+    """
+    A request sent with the `sent_session` session looked logged out. Update
+    `cookie` in place with a working session, from another thread or process
+    if one already found it, or by logging in again. Returns False if there's
+    nothing better than what was sent (so the response was right after all).
+    """
+    with _lock:
+        if cookie.get(SESSION_COOKIE) != sent_session:
+            # Another thread already replaced it
+            return True
+
+        saved = saved_session(cookie)
+        if saved and saved.get(SESSION_COOKIE) != sent_session:
+            cookie.update(saved)
+            return True
+
+        if time.time() - _logins.get(sent_session, 0) < FRESH_LOGIN_SECONDS:
+            return False
+
+        cookie.update(login(cookie, transport))
+        return cookie.get(SESSION_COOKIE) != sent_session
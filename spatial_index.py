@@ -0,0 +1,244 @@
+"""
+Where units were on the map. `SpatialIndex` records every position seen in a
+game (units at the start of each turn, where they were built or unloaded, and
+every tile of every move), and turns them into grids of turn x map height x
+map width, per unit type and owner. `Heatmaps` adds up many games' grids on the
+same map, e.g: where a player's first tanks usually go.
+
+Positions are recorded with the standard library, but the grids are NumPy
+arrays - they need `pip install numpy`. Grids are built by indexing with whole
+columns at once, so adding up hundreds of games never loops over units.
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import json
+import os
+
+from action_pipeline import ActionPipeline, Analysis
+
+
+# How many of each unit type a player built to count, per game
+FIRST_UNITS = 2
+
+# Darkest last
+SHADES = " .:-=+*#%@"
+
+
+def require_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Unit grids and heatmaps need numpy - pip install numpy")
+    return numpy
+
+
+class SpatialIndex(Analysis):
+
+    def __init__(self):
+        self.turn = array("i")
+        self.unit_id = array("q")
+        self.key = array("H")  # Index into `keys`
+        self.x = array("h")
+        self.y = array("h")
+
+        # Units we saw being built, rather than there from the start
+        self.built = array("q")
+        self.keys: List[Tuple[str, int]] = []  # (unit name, players_id)
+        self._key_codes: Dict[Tuple[str, int], int] = {}
+        self.players: Dict[int, Dict] = {}  # players_id: gameState player
+        self.turns = 0
+        self.width = 0
+        self.height = 0
+
+    def __len__(self) -> int:
+        return len(self.turn)
+
+    def register(self, pipeline: ActionPipeline) -> None:
+        pipeline.on("Build", self.on_build)
+        pipeline.on("Move", self.on_move)
+        pipeline.on("Unload", self.on_unload)
+
+    def start_turn(self, turn: int, turn_json: Dict) -> None:
+        game_state = turn_json["gameState"]
+        if not self.players:
+            self.players = {int(player["players_id"]): player for player in game_state["players"].values()}
+        self.turns = max(self.turns, turn + 1)
+        for data in game_state["units"].values():
+            self.add(turn, data)
+
+    def add(self, turn: int, unit: Dict, x: Optional[int] = None, y: Optional[int] = None) -> None:
+        x = unit.get("units_x") if x is None else x
+        y = unit.get("units_y") if y is None else y
+        if x is None or y is None:
+            # Out of vision
+            return
+        key = (unit["units_name"], int(unit["units_players_id"]))
+        code = self._key_codes.get(key)
+        if code is None:
+            code = self._key_codes[key] = len(self.keys)
+            self.keys.append(key)
+
+        self.turn.append(turn)
+        self.unit_id.append(int(unit["units_id"]))
+        self.key.append(code)
+        self.x.append(x)
+        self.y.append(y)
+        self.width = max(self.width, x + 1)
+        self.height = max(self.height, y + 1)
+
+    def on_build(self, turn: int, action: Dict) -> None:
+        self.built.append(int(action["newUnit"]["units_id"]))
+        self.add(turn, action["newUnit"])
+
+    def on_move(self, turn: int, action: Dict) -> None:
+        unit = action["unit"]
+        if "units_name" not in unit:
+            return
+        # The whole path, even where the unit was hidden (see `on_move` in the
+        # build order analyser)
+        for step in action.get("path", ()):
+            self.add(turn, unit, step["x"], step["y"])
+
+    def on_unload(self, turn: int, action: Dict) -> None:
+        self.add(turn, action["unloadedUnit"])
+
+    def columns(self) -> Dict[str, Any]:
+        numpy = require_numpy()
+        return {
+            name: numpy.frombuffer(column, dtype=column.typecode)
+            for name, column in (("turn", self.turn), ("unit_id", self.unit_id), ("key", self.key), ("x", self.x), ("y", self.y))
+        }
+
+    def key_codes(self, name: Optional[str] = None, players_id: Optional[int] = None) -> List[int]:
+        return [
+            code for code, (unit_name, unit_players_id) in enumerate(self.keys)
+            if (name is None or unit_name.lower() == name.lower())
+            and (players_id is None or unit_players_id == players_id)
+        ]
+
+    def select(self, name: Optional[str] = None, players_id: Optional[int] = None, first: Optional[int] = None, turns: Optional[int] = None) -> Any:
+        """
+        Which rows match, as a boolean array: units of this type and owner,
+        only the `first` of them built (lowest IDs - like `UnitsBuilt`,
+        predeployed units don't count), and only in the first `turns` turns.
+        """
+        numpy = require_numpy()
+        columns = self.columns()
+        rows = numpy.isin(columns["key"], self.key_codes(name, players_id))
+        if first is not None:
+            built = rows & numpy.isin(columns["unit_id"], numpy.frombuffer(self.built, dtype=self.built.typecode))
+            unit_ids = numpy.unique(columns["unit_id"][built])[:first]
+            rows &= numpy.isin(columns["unit_id"], unit_ids)
+        if turns is not None:
+            rows &= columns["turn"] < turns
+        return rows
+
+    def grid(self, name: Optional[str] = None, players_id: Optional[int] = None, first: Optional[int] = None) -> Any:
+        """
+        How many times matching units were seen on each tile, on each turn:
+        an array of turn x y x x.
+        """
+        numpy = require_numpy()
+        columns = self.columns()
+        rows = self.select(name, players_id, first)
+        grid = numpy.zeros((self.turns, self.height, self.width), dtype=numpy.uint16)
+        numpy.add.at(grid, (columns["turn"][rows], columns["y"][rows], columns["x"][rows]), 1)
+        return grid
+
+    def heatmap(self, name: Optional[str] = None, players_id: Optional[int] = None, first: Optional[int] = None, turns: Optional[int] = None) -> Any:
+        """
+        Like `grid`, but added up over the first `turns` turns: y x x.
+        """
+        numpy = require_numpy()
+        columns = self.columns()
+        rows = self.select(name, players_id, first, turns)
+        heat = numpy.zeros((self.height, self.width), dtype=numpy.uint32)
+        numpy.add.at(heat, (columns["y"][rows], columns["x"][rows]), 1)
+        return heat
+
+
+class Heatmaps():
+    """
+    Heatmaps added up over many games on one map, one for each unit type and
+    seat (first or second player - they start in different places). Only the
+    `first` units of each type a player built count. Like `OpeningStats`, each
+    game is folded in and forgotten, and the totals can be checkpointed.
+    """
+
+    def __init__(self, unit_names: Iterable[str], first: int = FIRST_UNITS):
+        self.unit_names = list(unit_names)
+        self.first = first
+        self.games = 0
+        self.game_ids: Set[str] = set()
+        self.maps: Dict[Tuple[str, int], Any] = {}  # (unit name, seat): y x x counts
+
+    def add_game(self, game_id: str, index: SpatialIndex, turns: Optional[int] = None, username: Optional[str] = None) -> None:
+        numpy = require_numpy()
+        seats = sorted(index.players.values(), key=lambda player: int(player["players_order"]))
+        for seat, player in enumerate(seats):
+            if username is not None and player["users_username"].lower() != username.lower():
+                continue
+            for unit_name in self.unit_names:
+                heat = index.heatmap(unit_name, int(player["players_id"]), self.first, turns)
+                total = self.maps.get((unit_name, seat))
+                if total is None:
+                    total = numpy.zeros((0, 0), dtype=numpy.uint32)
+                if total.shape != heat.shape:
+                    # Maps only grow as far as units were seen on them
+                    shape = (max(total.shape[0], heat.shape[0]), max(total.shape[1], heat.shape[1]))
+                    total = numpy.pad(total, [(0, shape[0] - total.shape[0]), (0, shape[1] - total.shape[1])])
+                    heat = numpy.pad(heat, [(0, shape[0] - heat.shape[0]), (0, shape[1] - heat.shape[1])])
+                total += heat
+                self.maps[(unit_name, seat)] = total
+
+        self.games += 1
+        self.game_ids.add(game_id)
+
+    def print_report(self) -> None:
+        print(f"==WHERE THE FIRST {self.first} OF EACH UNIT WENT, ACROSS {self.games} GAMES==")
+        for (unit_name, seat), heat in sorted(self.maps.items()):
+            print(f"\n{unit_name} (player {seat + 1}):")
+            if not heat.any():
+                print("  Never built")
+                continue
+            # Scale to the busiest tile
+            shades = (heat * (len(SHADES) - 1) + heat.max() - 1) // heat.max()
+            for row in shades:
+                print("  " + "".join(SHADES[shade] for shade in row))
+
+    def to_dict(self) -> Dict:
+        return {
+            "unit_names": self.unit_names,
+            "first": self.first,
+            "games": self.games,
+            "game_ids": sorted(self.game_ids),
+            "maps": [[unit_name, seat, heat.tolist()] for (unit_name, seat), heat in self.maps.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Heatmaps":
+        numpy = require_numpy()
+        heatmaps = cls(data["unit_names"], data["first"])
+        heatmaps.games = data["games"]
+        heatmaps.game_ids = set(data.get("game_ids", []))
+        for unit_name, seat, heat in data["maps"]:
+            heatmaps.maps[(unit_name, seat)] = numpy.array(heat, dtype=numpy.uint32) if heat else numpy.zeros((0, 0), dtype=numpy.uint32)
+        return heatmaps
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str, unit_names: Iterable[str], first: int = FIRST_UNITS) -> "Heatmaps":
+        if not os.path.exists(path):
+            return cls(unit_names, first)
+        with open(path) as f:
+            heatmaps = cls.from_dict(json.load(f))
+        if heatmaps.unit_names != list(unit_names) or heatmaps.first != first:
+            raise RuntimeError(f"{path} has heatmaps for {heatmaps.unit_names}, not {list(unit_names)} - delete it to start again")
+        return heatmaps
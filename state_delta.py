@@ -0,0 +1,80 @@
+"""
+Structural diffs between JSON objects, for storing a game's consecutive
+gameState snapshots as one full snapshot plus small per-turn changes.
+
+    patch = diff(old_state, new_state)
+    assert apply(old_state, patch) == new_state
+
+A patch is a dict with any of:
+    "s": {key: value}  - keys that were added, or changed to something that
+                         isn't a dict on both sides
+    "p": {key: patch}  - dicts that changed, as a patch of their own
+    "d": [key, ...]    - keys that were removed
+    "o": [key, ...]    - every key, in order (only if the order changed)
+"""
+
+from typing import Any, Dict, Optional
+
+
+def same(old: Any, new: Any) -> bool:
+    # 1 == 1.0 == True, but they aren't the same JSON
+    return type(old) is type(new) and old == new
+
+
+def diff(old: Dict, new: Dict) -> Optional[Dict]:
+    """
+    The patch that turns `old` into `new`, or None if they are the same.
+    """
+    changed: Dict[str, Any] = {}
+    patches: Dict[str, Dict] = {}
+
+    for key, value in new.items():
+        if key not in old:
+            changed[key] = value
+            continue
+        old_value = old[key]
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            patch = diff(old_value, value)
+            if patch is not None:
+                patches[key] = patch
+        elif not same(old_value, value):
+            changed[key] = value
+
+    removed = [key for key in old if key not in new]
+
+    patch: Dict[str, Any] = {}
+    if changed:
+        patch["s"] = changed
+    if patches:
+        patch["p"] = patches
+    if removed:
+        patch["d"] = removed
+
+    # `apply` keeps the old order, then adds new keys at the end. That's
+    # usually right (e.g: new units have the highest IDs).
+    if changed or removed:
+        applied_order = [key for key in old if key in new] + [key for key in new if key not in old]
+        if applied_order != list(new):
+            patch["o"] = list(new)
+
+    return patch or None
+
+
+def apply(old: Dict, patch: Optional[Dict]) -> Dict:
+    """
+    Apply a patch from `diff`. `old` isn't modified - anything the patch
+    doesn't touch is shared between `old` and the result, rather than copied.
+    """
+    if not patch:
+        return old
+
+    new = dict(old)
+    for key in patch.get("d", ()):
+        del new[key]
+    for key, sub_patch in patch.get("p", {}).items():
+        new[key] = apply(old[key], sub_patch)
+    new.update(patch.get("s", {}))
+
+    if "o" in patch:
+        new = {key: new[key] for key in patch["o"]}
+    return new
@@ -0,0 +1,155 @@
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional
+
+import collections
+import logging
+import profiling
+import threading
+import time
+
+if TYPE_CHECKING:
+    import requests
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 5.0  # Requests per second
+DEFAULT_BURST = 4
+DEFAULT_RETRIES = 4
+DEFAULT_TIMEOUT = 30
+# Request latencies kept for reporting - the newest ones, in a long-running process
+LATENCY_WINDOW = 10000
+
+
+class TokenBucket():
+    """
+    Allows `rate` requests per second on average, with up to `burst` requests
+    in quick succession. Thread safe - callers are queued in the order they
+    arrive.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Going negative reserves a slot in the future for this caller
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+class Transport():
+    """
+    The single way both tools talk to AWBW. Keeps connections alive between
+    requests, retries 5xx responses, timeouts and dropped connections with
+    exponential backoff, and rate limits everything that goes out.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = 0.5,
+        timeout: float = DEFAULT_TIMEOUT,
+        pool_size: int = 16,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.latencies: Deque[float] = collections.deque(maxlen=LATENCY_WINDOW)
+        self._latencies_lock = threading.Lock()
+        self.pool_size = pool_size
+        self._session: Optional["requests.Session"] = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        """
+        Created on first use - importing requests is a good part of startup
+        time, and runs served from the cache never need it.
+        """
+        with self._session_lock:
+            if self._session is None:
+                import requests.adapters
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> "requests.Response":
+        """
+        Send a request, retrying transient failures. Once out of retries, the
+        last 5xx response is returned, or the last exception is raised.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session
+        import requests
+
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                with profiling.phase("rate_limit_wait"):
+                    self.bucket.acquire()
+
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"{method} {url} failed ({e}), retrying")
+            else:
+                latency = time.perf_counter() - start
+                with self._latencies_lock:
+                    self.latencies.append(latency)
+                # Reading a streamed body here would defeat the point
+                size = int(response.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(response.content)
+                profiling.record_request(latency, size)
+                if response.status_code < 500 or attempt == self.retries:
+                    return response
+                logger.warning(f"{method} {url} got {response.status_code}, retrying")
+
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def get(self, url: str, **kwargs: Any) -> "requests.Response":
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> "requests.Response":
+        return self.request("POST", url, **kwargs)
+
+    def latency_summary(self) -> Dict[str, float]:
+        """
+        Request latency in seconds, for reporting (over the last
+        `LATENCY_WINDOW` requests).
+        """
+        with self._latencies_lock:
+            latencies = list(self.latencies)
+        return profiling.percentiles(latencies)
+
+
+_default_transport: Optional[Transport] = None
+
+
+def default_transport() -> Transport:
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = Transport()
+    return _default_transport
+
+
+def set_default_transport(transport: Transport) -> None:
+    global _default_transport
+    _default_transport = transport
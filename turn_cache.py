@@ -0,0 +1,204 @@
+import json_codec
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(SCRIPT_DIR, "cache", "turns.sqlite3")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# How long the newest turn of a live game is trusted after downloading it
+FRESH_SECONDS = 5
+# How many of the least recently used turns to look at at once, when evicting
+EVICT_BATCH = 64
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({self.stale} stale), "
+            f"{hit_rate:.1f}% hit rate, {self.stores} stored, {self.evictions} evicted"
+        )
+
+
+def is_game_over(turn_json: Dict) -> bool:
+    """
+    A turn can only change while the game is still being played. Once somebody
+    has been eliminated, every turn (including the newest) is final.
+    """
+    players = turn_json.get("gameState", {}).get("players", {})
+    return any(player.get("players_eliminated") == "Y" for player in players.values())
+
+
+class TurnCache():
+    """
+    Persistent, compressed cache of load_replay.php responses, keyed by
+    (game_id, turn). Shared by every tool, and safe to use from several threads
+    or processes at once.
+
+    The newest cached turn of a game that isn't over yet may still have actions
+    added to it, so it is treated as stale until a later turn is stored (or a
+    few seconds after it was downloaded).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # So replacing a turn counts as deleting the old one (see `cache_size`)
+        self._db.execute("PRAGMA recursive_triggers=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " game_id INTEGER NOT NULL,"
+            " turn INTEGER NOT NULL,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " final INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (game_id, turn))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS turns_last_used ON turns (last_used)")
+        self._db.commit()
+
+        # The total size of every turn, kept up to date by triggers, so it is
+        # right for every process sharing the cache without adding it all up
+        self._db.executescript(
+            "BEGIN IMMEDIATE;"
+            "CREATE TABLE IF NOT EXISTS cache_size (total INTEGER NOT NULL);"
+            "INSERT INTO cache_size SELECT COALESCE(SUM(size), 0) FROM turns WHERE NOT EXISTS (SELECT 1 FROM cache_size);"
+            "CREATE TRIGGER IF NOT EXISTS turns_added AFTER INSERT ON turns"
+            " BEGIN UPDATE cache_size SET total = total + NEW.size; END;"
+            "CREATE TRIGGER IF NOT EXISTS turns_removed AFTER DELETE ON turns"
+            " BEGIN UPDATE cache_size SET total = total - OLD.size; END;"
+            "COMMIT;"
+        )
+
+    def get(self, game_id: int, turn: int) -> Optional[Dict]:
+        game_id = int(game_id)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, final, last_used FROM turns WHERE game_id = ? AND turn = ?",
+                (game_id, turn),
+            ).fetchone()
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            data, final, last_used = row
+            if not final:
+                newer = self._db.execute(
+                    "SELECT 1 FROM turns WHERE game_id = ? AND turn > ? LIMIT 1",
+                    (game_id, turn),
+                ).fetchone()
+                final = newer is not None
+                if not final and time.time() - last_used > FRESH_SECONDS:
+                    # Newest turn of a live game - it may have changed since
+                    self.stats.misses += 1
+                    self.stats.stale += 1
+                    return None
+
+            # Leave a live game's newest turn alone, so it still goes stale
+            if final:
+                self._db.execute(
+                    "UPDATE turns SET last_used = ?, final = 1 WHERE game_id = ? AND turn = ?",
+                    (time.time(), game_id, turn),
+                )
+                self._db.commit()
+            self.stats.hits += 1
+
+        return json_codec.loads(zlib.decompress(data))
+
+    def put(self, game_id: int, turn: int, turn_json: Dict, raw: Optional[bytes] = None) -> None:
+        """
+        Save a turn. Pass the response body as `raw` if it's still around, so
+        it doesn't need encoding again.
+        """
+        game_id = int(game_id)
+        data = zlib.compress(raw if raw is not None else json_codec.dumps(turn_json))
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO turns (game_id, turn, data, size, final, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (game_id, turn, data, len(data), int(is_game_over(turn_json)), time.time()),
+            )
+            # Any earlier turn can no longer change
+            self._db.execute(
+                "UPDATE turns SET final = 1 WHERE game_id = ? AND turn < ? AND final = 0",
+                (game_id, turn),
+            )
+            self.stats.stores += 1
+            self._evict()
+            self._db.commit()
+
+    def forget(self, game_id: int, turn: int) -> None:
+        """
+        Drop a turn that turned out to be wrong.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM turns WHERE game_id = ? AND turn = ?", (int(game_id), turn))
+            self._db.commit()
+
+    def latest_turn(self, game_id: int) -> Optional[int]:
+        """
+        The newest turn we have for a game, or None if we have nothing for it.
+        """
+        with self._lock:
+            (turn,) = self._db.execute("SELECT MAX(turn) FROM turns WHERE game_id = ?", (int(game_id),)).fetchone()
+        return turn
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used turns until the cache fits in `max_bytes`.
+        Only the oldest few turns are read, a batch at a time.
+        """
+        total = self._size()
+        while total > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT game_id, turn, size FROM turns ORDER BY last_used LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for game_id, turn, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM turns WHERE game_id = ? AND turn = ?", (game_id, turn))
+                total -= size
+                self.stats.evictions += 1
+
+    def _size(self) -> int:
+        (total,) = self._db.execute("SELECT total FROM cache_size").fetchone()
+        return total
+
+    def size(self) -> int:
+        with self._lock:
+            return self._size()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM turns")
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,200 @@
+"""
+Every sighting of every unit in a game, not just the newest one: where it was,
+its HP, and what showed it to us, on each turn.
+
+Sightings are kept as columns (one `array` per field), so each one costs under
+30 bytes (with its index), and they can be handed to NumPy without copying.
+They are indexed by unit and by turn:
+
+    timeline.position(unit_id, turn)     Where it was last seen, as of a turn
+    timeline.hp_history(unit_id)         [(turn, HP), ...]
+    timeline.trajectories("Tank", enemy_players_id)
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from data_objects import Unit
+
+
+# What showed us the unit
+SOURCES = ("turn_start", "discovered", "Build", "Move", "Fire", "Join", "Unload")
+SOURCE_CODES = {source: code for code, source in enumerate(SOURCES)}
+
+# Stands in for a position or HP we don't know
+MISSING = -1
+
+TIMELINE_FIELDS: Dict[str, type] = {
+    "game_id": int,
+    "turn": int,
+    "day": int,
+    "units_id": int,
+    "units_name": str,
+    "units_players_id": int,
+    "units_x": int,
+    "units_y": int,
+    "units_hit_points": float,
+    "extra_distance": int,
+    "source": str,
+}
+
+COLUMNS = ("turn", "unit_id", "x", "y", "hp", "extra_distance", "source")
+
+
+class UnitTimeline():
+
+    def __init__(self):
+        self.turn = array("i")
+        self.unit_id = array("q")
+        self.x = array("h")
+        self.y = array("h")
+        self.hp = array("f")
+        self.extra_distance = array("h")
+        self.source = array("B")
+
+        self.units: Dict[int, Tuple[str, int]] = {}  # units_id: (name, players_id)
+        self._by_unit: Dict[int, array] = {}  # units_id: row numbers
+        # Each turn seen, in order, its day, and its first row
+        self._turns = array("i")
+        self._days = array("i")
+        self._turn_starts = array("I")
+
+    def __len__(self) -> int:
+        return len(self.turn)
+
+    @property
+    def nbytes(self) -> int:
+        columns = sum(column.itemsize * len(column) for column in self.columns().values())
+        return columns + sum(rows.itemsize * len(rows) for rows in self._by_unit.values())
+
+    def columns(self) -> Dict[str, array]:
+        return {name: getattr(self, name) for name in COLUMNS}
+
+    def start_turn(self, turn: int, day: int) -> None:
+        """
+        Call before adding a turn's sightings. Seeing a turn again (e.g: the
+        newest turn of a live game) replaces what it had before.
+        """
+        if self._turns and turn <= self._turns[-1]:
+            self.truncate(self._turn_starts[bisect_left(self._turns, turn)])
+        self._turns.append(turn)
+        self._days.append(day)
+        self._turn_starts.append(len(self))
+
+    def truncate(self, rows: int) -> None:
+        """
+        Forget everything from row `rows` onwards.
+        """
+        for column in self.columns().values():
+            del column[rows:]
+        for unit_rows in self._by_unit.values():
+            while unit_rows and unit_rows[-1] >= rows:
+                unit_rows.pop()
+        while self._turn_starts and self._turn_starts[-1] >= rows:
+            self._turns.pop()
+            self._days.pop()
+            self._turn_starts.pop()
+
+    def add(self, turn: int, unit: Unit, source: str) -> None:
+        unit_id = int(unit.units_id)
+        row = len(self.turn)
+        self.turn.append(turn)
+        self.unit_id.append(unit_id)
+        self.x.append(MISSING if unit.units_x is None else unit.units_x)
+        self.y.append(MISSING if unit.units_y is None else unit.units_y)
+        self.hp.append(MISSING if unit.units_hit_points is None else unit.units_hit_points)
+        self.extra_distance.append(unit.extra_distance or 0)
+        self.source.append(SOURCE_CODES[source])
+
+        self.units[unit_id] = (unit.units_name, unit.units_players_id)
+        unit_rows = self._by_unit.get(unit_id)
+        if unit_rows is None:
+            unit_rows = self._by_unit[unit_id] = array("I")
+        unit_rows.append(row)
+
+    def rows_for_unit(self, unit_id: int) -> array:
+        return self._by_unit.get(unit_id, array("I"))
+
+    def rows_for_turn(self, turn: int) -> range:
+        index = bisect_left(self._turns, turn)
+        if index == len(self._turns) or self._turns[index] != turn:
+            return range(0)
+        end = self._turn_starts[index + 1] if index + 1 < len(self._turns) else len(self)
+        return range(self._turn_starts[index], end)
+
+    def row(self, row: int) -> Dict[str, Any]:
+        unit_id = self.unit_id[row]
+        name, players_id = self.units[unit_id]
+        hp = self.hp[row]
+        turn = self.turn[row]
+        return {
+            "turn": turn,
+            "day": self._days[bisect_left(self._turns, turn)],
+            "units_id": unit_id,
+            "units_name": name,
+            "units_players_id": players_id,
+            "units_x": None if self.x[row] == MISSING else self.x[row],
+            "units_y": None if self.y[row] == MISSING else self.y[row],
+            "units_hit_points": None if hp == MISSING else hp,
+            "extra_distance": self.extra_distance[row],
+            "source": SOURCES[self.source[row]],
+        }
+
+    def history(self, unit_id: int) -> List[Dict[str, Any]]:
+        return [self.row(row) for row in self.rows_for_unit(unit_id)]
+
+    def position(self, unit_id: int, turn: int) -> Optional[Tuple[int, int]]:
+        """
+        Where the unit was last seen, as of the end of `turn`.
+        """
+        rows = self.rows_for_unit(unit_id)
+        turns = self.turn
+        # Rows are in turn order, so binary search for the end of `turn`
+        end = bisect_right(rows, turn, key=lambda row: turns[row])
+        for row in reversed(rows[:end]):
+            if self.x[row] != MISSING:
+                return self.x[row], self.y[row]
+        return None
+
+    def hp_history(self, unit_id: int) -> List[Tuple[int, float]]:
+        """
+        (turn, HP) every time the unit's HP changed (or it was first seen).
+        """
+        history: List[Tuple[int, float]] = []
+        for row in self.rows_for_unit(unit_id):
+            hp = self.hp[row]
+            if hp != MISSING and (not history or history[-1][1] != hp):
+                history.append((self.turn[row], hp))
+        return history
+
+    def unit_ids(self, name: Optional[str] = None, players_id: Optional[int] = None) -> List[int]:
+        return [
+            unit_id for unit_id, (unit_name, unit_players_id) in self.units.items()
+            if (name is None or unit_name.lower() == name.lower())
+            and (players_id is None or unit_players_id == players_id)
+        ]
+
+    def trajectories(self, name: Optional[str] = None, players_id: Optional[int] = None) -> Dict[int, List[Tuple[int, float]]]:
+        """
+        HP history of every matching unit, e.g: every enemy tank.
+        """
+        return {unit_id: self.hp_history(unit_id) for unit_id in self.unit_ids(name, players_id)}
+
+    def records(self, game_id: int) -> Iterator[Dict[str, Any]]:
+        """
+        Every sighting, for exporting (see `TIMELINE_FIELDS`).
+        """
+        for row in range(len(self)):
+            yield {"game_id": game_id, **self.row(row)}
+
+    def as_numpy(self) -> Dict[str, Any]:
+        """
+        The columns as NumPy arrays, sharing memory with the timeline. Needs
+        numpy installed. Nothing can be added while the arrays are in use.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("Viewing the timeline as NumPy arrays needs numpy - pip install numpy")
+        return {name: numpy.frombuffer(column, dtype=column.typecode) for name, column in self.columns().items()}